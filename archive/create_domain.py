@@ -1,60 +1,50 @@
 import requests
-import json
+import argparse
+import orjson
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
-def get_user_input():
-    """
-    Gets the necessary API keys and domain name from the user.
-    It first checks for environment variables, and if not found,
-    prompts the user for input.
-    """
-    print("Loading configuration...")
-    mailgun_api_key = os.environ.get("MAILGUN_API_KEY")
-    cloudflare_api_key = os.environ.get("CLOUDFLARE_API_KEY")
-    cloudflare_email = os.environ.get("CLOUDFLARE_EMAIL")
-    
-    if mailgun_api_key:
-        print("✓ Mailgun API Key found in environment variables.")
-    else:
-        print("✗ Mailgun API Key not found. Please provide it.")
-        mailgun_api_key = input("Enter your Mailgun API Key: ")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from api.cloudflare_client import BATCH_SIZE, MAX_CONNECTIONS, CloudflareClient, chunked, record_already_exists
+from api.mailgun_client import CONFLICT_STATUS_CODES, MailgunClient
+from models.dns_record import DNSRecord
+from utils.config import Config
 
-    if cloudflare_api_key:
-        print("✓ Cloudflare API Key found in environment variables.")
-    else:
-        print("✗ Cloudflare API Key not found. Please provide it.")
-        cloudflare_api_key = input("Enter your Cloudflare API Key: ")
+# Upper bound on simultaneous API requests, kept low to stay clear of
+# Cloudflare's rate limiter and matched to the client's connection pool so
+# every worker reuses an open connection.
+MAX_CONCURRENT_REQUESTS = MAX_CONNECTIONS
 
-    if cloudflare_email:
-        print(f"✓ Cloudflare Email found in environment variables.")
-    else:
-        print("✗ Cloudflare Email not found. Please provide it.")
-        cloudflare_email = input("Enter your Cloudflare Email: ")
-        
-    domain_name = input("\nEnter the domain you want to set up (e.g., example.com): ")
-    
-    return mailgun_api_key, cloudflare_api_key, cloudflare_email, domain_name
+def _parse_records(data: dict) -> dict:
+    """
+    Converts a Mailgun domain response into typed sending and receiving record lists.
+    """
+    return {
+        key: [
+            DNSRecord(r.get("name"), r["record_type"], r.get("value"),
+                      int(r["priority"]) if r.get("priority") else None)
+            for r in data.get(key, ())
+        ]
+        for key in ('sending_dns_records', 'receiving_dns_records')
+    }
 
-def get_mailgun_domain_details(api_key, domain_name):
+def get_mailgun_domain_details(mailgun, domain_name):
     """Fetches details for an existing Mailgun domain."""
     print(f"Fetching details for existing Mailgun domain: {domain_name}...")
     try:
-        response = requests.get(
-            f"https://api.mailgun.net/v3/domains/{domain_name}",
-            auth=("api", api_key)
-        )
-        response.raise_for_status()
-        print("Successfully fetched domain details.")
-        # The domain details are nested under the 'domain' key in the response
-        return response.json().get('domain')
-    except requests.exceptions.HTTPError as err:
-        print(f"Error fetching Mailgun domain details: {err}")
-        return None
+        success, result = mailgun.get_domain(domain_name)
     except requests.exceptions.RequestException as e:
         print(f"A network error occurred while fetching domain details: {e}")
         return None
+    if not success:
+        print(f"Error fetching Mailgun domain details: {result.get('error')}")
+        return None
+    print("Successfully fetched domain details.")
+    # The DNS records sit next to the 'domain' key at the top level of the response
+    return _parse_records(result)
 
-def create_mailgun_domain(api_key, domain_name):
+def create_mailgun_domain(mailgun, domain_name):
     """
     Creates a new domain in Mailgun or fetches details if it already exists.
     """
@@ -62,187 +52,202 @@ def create_mailgun_domain(api_key, domain_name):
     print(f"\nAttempting to create Mailgun domain: {mailgun_domain}...")
     
     try:
-        response = requests.post(
-            "https://api.mailgun.net/v3/domains",
-            auth=("api", api_key),
-            data={"name": mailgun_domain}
-        )
-        response.raise_for_status()
-        print("Mailgun domain created successfully.")
-        return mailgun_domain, response.json()
-    except requests.exceptions.HTTPError as err:
-        if "already exists" in str(err).lower():
-            print("The domain already exists in Mailgun.")
-            # If the domain exists, we must fetch its records via a GET request.
-            domain_details = get_mailgun_domain_details(api_key, mailgun_domain)
-            return mailgun_domain, domain_details
-        
-        print(f"Error creating Mailgun domain: {err}")
-        return None, None
+        # Leave the SMTP credentials for Mailgun to manage rather than setting a password
+        success, result = mailgun.create_domain(mailgun_domain, smtp_password=None)
     except requests.exceptions.RequestException as e:
         print(f"A network error occurred: {e}")
         return None, None
 
+    if success:
+        print("Mailgun domain created successfully.")
+        return mailgun_domain, _parse_records(result)
+
+    if result.get('status_code') in CONFLICT_STATUS_CODES:
+        # If the domain exists, we must fetch its records via a GET request.
+        domain_details = get_mailgun_domain_details(mailgun, mailgun_domain)
+        if domain_details is not None:
+            print("The domain already exists in Mailgun.")
+            return mailgun_domain, domain_details
+
+    print(f"Error creating Mailgun domain: {result.get('message', result)}")
+    return None, None
 
-def get_cloudflare_zone_id(api_key, email, domain_name):
+
+def get_cloudflare_zone_id(cloudflare, domain_name):
     """
     Retrieves the Cloudflare Zone ID for the given domain.
     """
     print(f"\nFinding Cloudflare zone for {domain_name}...")
-    headers = {
-        "X-Auth-Email": email,
-        "X-Auth-Key": api_key,
-        "Content-Type": "application/json"
-    }
     try:
-        response = requests.get(
-            f"https://api.cloudflare.com/client/v4/zones?name={domain_name}",
-            headers=headers
-        )
-        response.raise_for_status()
-        zones = response.json().get("result", [])
-        if zones:
-            print("✓ Cloudflare zone found.")
-            return zones[0]["id"]
-        else:
-            print("✗ Cloudflare zone not found.")
-            return None
-    except requests.exceptions.HTTPError as err:
-        print(f"Error finding Cloudflare zone: {err}")
-        return None
+        zone_id = cloudflare.get_zone_id(domain_name)
     except requests.exceptions.RequestException as e:
         print(f"A network error occurred: {e}")
         return None
+    if zone_id:
+        print("✓ Cloudflare zone found.")
+    else:
+        print("✗ Cloudflare zone not found.")
+    return zone_id
+
+def get_cloudflare_dns_records(cloudflare, zone_id):
+    """
+    Retrieves every DNS record currently in the Cloudflare zone.
+    """
+    try:
+        return cloudflare.get_dns_records(zone_id)
+    except requests.exceptions.RequestException as e:
+        print(f"  ⚠ Could not list existing DNS records, adding all records: {e}")
+        return []
+
+TABLE_ROW = "{:<6} {:<35} {:<8} {:<30}".format
+
+def _table_row(record, name):
+    value = record.content or ""
+    # Truncate long values for display
+    display_value = value if len(value) <= 30 else value[:30] + "..."
+    return TABLE_ROW(record.type or "", name or "", record.priority or "", display_value)
+
+def _iter_table_lines(mailgun_dns_records, domain_name):
+    yield "\n" + "="*80
+    yield "DNS RECORDS FOR MANUAL APPLICATION"
+    yield "="*80
+    yield TABLE_ROW("TYPE", "NAME", "PRIORITY", "VALUE")
+    yield "-"*80
+    for record in mailgun_dns_records.get('sending_dns_records', ()):
+        yield _table_row(record, record.name)
+    # MX records use the mailgun domain as the name
+    mx_name = f"mg.{domain_name}"
+    for record in mailgun_dns_records.get('receiving_dns_records', ()):
+        yield _table_row(record, mx_name)
+    yield "-"*80
+    yield "Note: Full record values may be truncated for display. Check the verification"
+    yield "output above for complete values."
+    yield "="*80
 
 def display_dns_records_table(mailgun_dns_records, domain_name):
     """
     Displays DNS records in a formatted table for manual application if needed.
     """
-    print("\n" + "="*80)
-    print("DNS RECORDS FOR MANUAL APPLICATION")
-    print("="*80)
-    print(f"{'TYPE':<6} {'NAME':<35} {'PRIORITY':<8} {'VALUE':<30}")
-    print("-"*80)
-    
-    # Process sending DNS records
-    for record in mailgun_dns_records.get('sending_dns_records', []):
-        record_type = record.get("record_type", "")
-        name = record.get("name", "")
-        value = record.get("value", "")
-        priority = record.get("priority", "")
-        
-        # Truncate long values for display
-        display_value = value[:30] + "..." if len(value) > 30 else value
-        print(f"{record_type:<6} {name:<35} {priority:<8} {display_value:<30}")
-    
-    # Process receiving DNS records (MX records)
-    for record in mailgun_dns_records.get('receiving_dns_records', []):
-        record_type = record.get("record_type", "")
-        # MX records use the main domain as the name
-        name = f"mg.{domain_name}"
-        value = record.get("value", "")
-        priority = record.get("priority", "")
-        
-        display_value = value[:30] + "..." if len(value) > 30 else value
-        print(f"{record_type:<6} {name:<35} {priority:<8} {display_value:<30}")
-    
-    print("-"*80)
-    print("Note: Full record values may be truncated for display. Check the verification")
-    print("output above for complete values.")
-    print("="*80)
+    sys.stdout.writelines(line + "\n" for line in _iter_table_lines(mailgun_dns_records, domain_name))
 
-def add_dns_records_to_cloudflare(api_key, email, zone_id, mailgun_dns_records, domain_name):
+def build_cloudflare_records(mailgun_dns_records, domain_name):
     """
-    Adds the necessary DNS records from Mailgun to Cloudflare.
+    Converts Mailgun sending and receiving records into Cloudflare record payloads.
     """
-    print("\nAdding DNS records to Cloudflare...")
-    headers = {
-        "X-Auth-Email": email,
-        "X-Auth-Key": api_key,
-        "Content-Type": "application/json"
-    }
+    records = []
 
-    # Process sending DNS records
-    sending_records = mailgun_dns_records.get('sending_dns_records', [])
-    receiving_records = mailgun_dns_records.get('receiving_dns_records', [])
-    
-    print(f"\nProcessing {len(sending_records)} sending DNS records...")
-    for record in sending_records:
-        record_type = record.get("record_type")
-        name = record.get("name")
-        value = record.get("value")
-        
-        if not name or not value:
+    for record in mailgun_dns_records.get('sending_dns_records', []):
+        if not record.name or not record.content:
             print(f"  ⚠ Skipping incomplete record: {record}")
             continue
-        
-        # Cloudflare uses 'content' for the record value
-        data = {
-            "type": record_type,
-            "name": name,
-            "content": value,
-            "ttl": 3600 # 1 hour
-        }
-
-        try:
-            response = requests.post(
-                f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records",
-                headers=headers,
-                json=data
-            )
-            response.raise_for_status()
-            print(f"  ✓ Successfully added {record_type} record for {name}")
-        except requests.exceptions.HTTPError as err:
-            # Check if the record already exists
-            if "already exists" in str(err).lower():
-                 print(f"  - DNS record for {name} already exists.")
-            else:
-                print(f"  ✗ Error adding DNS record for {name}: {err}")
-                print(f"    Record data: {data}")
-        except requests.exceptions.RequestException as e:
-            print(f"  ✗ A network error occurred while adding DNS record for {name}: {e}")
-
-    print(f"\nProcessing {len(receiving_records)} receiving DNS records (MX)...")
-    for record in receiving_records:
-        record_type = record.get("record_type")
-        # For MX records, the name should be the mailgun domain
-        name = f"mg.{domain_name}"
-        value = record.get("value")
-        priority = record.get("priority")
-        
-        if not value:
+        records.append(_cloudflare_record(record, record.name))
+
+    for record in mailgun_dns_records.get('receiving_dns_records', []):
+        if not record.content:
             print(f"  ⚠ Skipping incomplete MX record: {record}")
             continue
-        
-        # Special handling for MX records
-        data = {
-            "type": record_type,
-            "name": name,
-            "content": value,
-            "priority": int(priority) if priority else 10,
-            "ttl": 3600 # 1 hour
-        }
-
-        try:
-            response = requests.post(
-                f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records",
-                headers=headers,
-                json=data
-            )
-            response.raise_for_status()
-            print(f"  ✓ Successfully added {record_type} record for {name} (priority: {priority})")
-        except requests.exceptions.HTTPError as err:
-            # Check if the record already exists
-            if "already exists" in str(err).lower():
-                 print(f"  - DNS record for {name} already exists.")
-            else:
-                print(f"  ✗ Error adding DNS record for {name}: {err}")
-                print(f"    Record data: {data}")
-        except requests.exceptions.RequestException as e:
-            print(f"  ✗ A network error occurred while adding DNS record for {name}: {e}")
-
-
-def verify_mailgun_domain(api_key, domain_name):
+        # For MX records, the name should be the mailgun domain
+        records.append(_cloudflare_record(record, f"mg.{domain_name}"))
+
+    return records
+
+def _cloudflare_record(record, name):
+    # Cloudflare uses 'content' for the record value
+    data = {
+        "type": record.type,
+        "name": name,
+        "content": record.content,
+        "ttl": 3600 # 1 hour
+    }
+    if record.type == "MX":
+        data["priority"] = int(record.priority) if record.priority else 10
+    return data
+
+def add_dns_record_to_cloudflare(cloudflare, zone_id, data):
+    """
+    Adds a single DNS record to Cloudflare.
+    """
+    name = data["name"]
+    try:
+        success, result = cloudflare.create_dns_record(
+            zone_id, data["type"], name, data["content"],
+            ttl=data["ttl"], priority=data.get("priority")
+        )
+    except requests.exceptions.RequestException as e:
+        print(f"  ✗ A network error occurred while adding DNS record for {name}: {e}")
+        return
+
+    if success:
+        print(f"  ✓ Successfully added {data['type']} record for {name}")
+    # Check if the record already exists
+    elif record_already_exists(result):
+        print(f"  - DNS record for {name} already exists.")
+    else:
+        print(f"  ✗ Error adding DNS record for {name}: {result.get('errors')}")
+        print(f"    Record data: {data}")
+
+def add_dns_record_batch_to_cloudflare(cloudflare, zone_id, records):
+    """
+    Adds a batch of DNS records to Cloudflare in a single request.
+    Returns False if Cloudflare rejected the batch because a record already
+    exists, so the records should be retried individually.
+    """
+    try:
+        success, result = cloudflare.batch_dns_records(zone_id, posts=records)
+    except requests.exceptions.RequestException as e:
+        print(f"  ✗ A network error occurred while adding DNS records: {e}")
+        return True
+
+    if not success:
+        if record_already_exists(result):
+            print(f"  - Batch request rejected ({result.get('errors')}), adding records individually...")
+            return False
+        # Other errors would fail each individual create the same way
+        print(f"  ✗ Error adding DNS records: {result.get('errors')}")
+        return True
+    for data in records:
+        print(f"  ✓ Successfully added {data['type']} record for {data['name']}")
+    return True
+
+def add_dns_records_to_cloudflare(cloudflare, zone_id, mailgun_dns_records, domain_name):
+    """
+    Adds the necessary DNS records from Mailgun to Cloudflare.
+
+    Records are sent to the batch endpoint in chunks of at most BATCH_SIZE
+    (set CLOUDFLARE_BATCH_SIZE to raise it on paid plans). If Cloudflare
+    rejects a batch because one record already exists, which fails the
+    whole batch, that batch's records are retried one at a time.
+    """
+    print("\nAdding DNS records to Cloudflare...")
+    records = build_cloudflare_records(mailgun_dns_records, domain_name)
+
+    # One listing of the zone replaces a failed create for every record that is already there
+    existing = {(r.get("type"), r.get("name"), r.get("content"))
+                for r in get_cloudflare_dns_records(cloudflare, zone_id)}
+    new_records = []
+    for data in records:
+        if (data["type"], data["name"], data["content"]) in existing:
+            print(f"  - DNS record for {data['name']} already exists.")
+        else:
+            new_records.append(data)
+    records = new_records
+
+    if not records:
+        print("  ⚠ No DNS records to add.")
+        return
+
+    print(f"\nSubmitting {len(records)} DNS records in batches of up to {BATCH_SIZE}...")
+    rejected = []
+    for chunk in chunked(records, BATCH_SIZE):
+        if not add_dns_record_batch_to_cloudflare(cloudflare, zone_id, chunk):
+            rejected.extend(chunk)
+
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        for data in rejected:
+            executor.submit(add_dns_record_to_cloudflare, cloudflare, zone_id, data)
+
+
+def verify_mailgun_domain(mailgun, domain_name, debug=False):
     """
     Initiates the verification process for the Mailgun domain and prints the result.
     """
@@ -251,12 +256,10 @@ def verify_mailgun_domain(api_key, domain_name):
     print(f"{'='*60}")
     print(f"Initiating verification for {domain_name}...")
     try:
-        response = requests.put(
-            f"https://api.mailgun.net/v3/domains/{domain_name}/verify",
-            auth=("api", api_key)
-        )
-        response.raise_for_status()
-        result = response.json()
+        success, result = mailgun.verify_domain(domain_name)
+        if not success:
+            print(f"✗ Error initiating verification: {result.get('message', result)}")
+            return
         
         print("✓ Verification initiated successfully.")
         
@@ -285,12 +288,12 @@ def verify_mailgun_domain(api_key, domain_name):
         print("You can check verification status later using the Mailgun dashboard.")
         print(f"{'='*60}")
         
-        # Still show full JSON for debugging if needed
-        print(f"\nFull verification response (for debugging):")
-        print(json.dumps(result, indent=2))
+        if debug:
+            print(f"\nFull verification response (for debugging):")
+            # Flush pending text output before writing the encoded bytes directly
+            sys.stdout.flush()
+            sys.stdout.buffer.write(orjson.dumps(result, option=orjson.OPT_INDENT_2) + b"\n")
         
-    except requests.exceptions.HTTPError as err:
-        print(f"✗ Error initiating verification: {err}")
     except requests.exceptions.RequestException as e:
         print(f"✗ A network error occurred during verification: {e}")
 
@@ -299,18 +302,31 @@ def main():
     """
     Main function to orchestrate the domain setup process.
     """
+    parser = argparse.ArgumentParser(description="Set up a Mailgun domain with DNS records in Cloudflare.")
+    parser.add_argument("--debug", action="store_true",
+                        help="print the full Mailgun verification response")
+    args = parser.parse_args()
+
     print("🚀 MAILGUN DOMAIN SETUP AUTOMATION")
     print("=" * 50)
     
-    mailgun_api_key, cloudflare_api_key, cloudflare_email, domain_name = get_user_input()
+    print("Loading configuration...")
+    cfg = Config.load()
+    mailgun = MailgunClient.from_config(cfg)
+    cloudflare = CloudflareClient.from_config(cfg)
+    domain_name = input("\nEnter the domain you want to set up (e.g., example.com): ")
 
-    mailgun_domain, mailgun_response = create_mailgun_domain(mailgun_api_key, domain_name)
+    # The Mailgun domain and the Cloudflare zone are independent, so look them up concurrently
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        mailgun_future = executor.submit(create_mailgun_domain, mailgun, domain_name)
+        zone_future = executor.submit(get_cloudflare_zone_id, cloudflare, domain_name)
+        mailgun_domain, mailgun_response = mailgun_future.result()
+        zone_id = zone_future.result()
 
     if mailgun_domain and mailgun_response:
-        zone_id = get_cloudflare_zone_id(cloudflare_api_key, cloudflare_email, domain_name)
         if zone_id:
-            add_dns_records_to_cloudflare(cloudflare_api_key, cloudflare_email, zone_id, mailgun_response, domain_name)
-            verify_mailgun_domain(mailgun_api_key, mailgun_domain)
+            add_dns_records_to_cloudflare(cloudflare, zone_id, mailgun_response, domain_name)
+            verify_mailgun_domain(mailgun, mailgun_domain, debug=args.debug)
             # Display DNS records table for manual reference
             display_dns_records_table(mailgun_response, domain_name)
             
@@ -1 +1,4 @@
-# This file is intentionally left blank.
\ No newline at end of file
+# (connect, read) timeout applied to every Cloudflare and Mailgun call, so a
+# stalled connection can't hold a pooled connection, and the setup waiting
+# on it, indefinitely
+REQUEST_TIMEOUT = (10, 30)
@@ -1,4 +1,133 @@
+import hashlib
+import os
+import orjson
+import random
 import requests
+import threading
+import time
+from itertools import islice
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from api import REQUEST_TIMEOUT
+from utils.cache import TTLCache
+from utils.rate_limit import RateLimiter
+
+# Cloudflare allows 1200 requests per 5 minutes; 4 per second stays well under that
+REQUESTS_PER_SECOND = 4
+
+# The budget is per account, and the app builds a client for every request,
+# so each account's limiter is shared by all of its clients in the process.
+# Keyed by account fingerprint.
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def _account_limiter(account):
+    with _limiters_lock:
+        limiter = _limiters.get(account)
+        if limiter is None:
+            limiter = _limiters[account] = RateLimiter(REQUESTS_PER_SECOND)
+        return limiter
+
+# Rate-limited (429) responses are retried with exponential backoff plus jitter,
+# waiting at most RATE_LIMIT_MAX_BACKOFF seconds between attempts
+RATE_LIMIT_RETRIES = 3
+RATE_LIMIT_MAX_BACKOFF = 30
+
+# After this many rate-limited responses in a row, stop calling Cloudflare for
+# CIRCUIT_BREAKER_COOLDOWN seconds instead of adding to the backlog
+CIRCUIT_BREAKER_THRESHOLD = 5
+CIRCUIT_BREAKER_COOLDOWN = 60
+
+class _CircuitState:
+    """Circuit breaker state for one account, shared by all of its clients"""
+    __slots__ = ('lock', 'consecutive_429', 'open_until')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.consecutive_429 = 0
+        self.open_until = 0.0
+
+# Like the rate limiter, the breaker has to see every request made for an
+# account to notice that it is being throttled. Keyed by account fingerprint.
+_circuits = {}
+_circuits_lock = threading.Lock()
+
+def _account_circuit(account):
+    with _circuits_lock:
+        circuit = _circuits.get(account)
+        if circuit is None:
+            circuit = _circuits[account] = _CircuitState()
+        return circuit
+
+# Zone IDs found by get_zone_id, shared by every client in the process so
+# repeated setups for the same domain don't look the zone up again. Keyed by
+# (account fingerprint, email, zone name).
+ZONE_CACHE_TTL = 600
+_zone_cache = TTLCache(ZONE_CACHE_TTL)
+
+# Keep-alive connections held open to the API. Requests beyond this wait for a
+# free connection instead of opening throwaway ones that each need a new TLS
+# handshake.
+MAX_CONNECTIONS = 10
+
+# Connection pool shared by every client's session. The app builds a client
+# per request, so a per-client pool would be thrown away, along with its open
+# connections, after a single setup. Credentials travel in session headers,
+# so sharing connections between accounts is safe. Rate limiting (429) is
+# handled by _request so POSTs are retried too.
+_adapter = HTTPAdapter(
+    pool_connections=1, pool_maxsize=MAX_CONNECTIONS, pool_block=True,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[502, 503, 504],
+                      respect_retry_after_header=True, raise_on_status=False))
+
+# Most operations Cloudflare accepts in one batch request: 200 on the free plan,
+# 3500 on paid plans
+BATCH_SIZE = int(os.environ.get("CLOUDFLARE_BATCH_SIZE", 200))
+
+# Cloudflare error codes reporting that the record is already in the zone
+RECORD_EXISTS_ERROR_CODES = frozenset({81053, 81057, 81058})
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of sending a request while Cloudflare calls are suspended"""
+
+def _rate_limit_backoff(attempt, response):
+    retry_after = response.headers.get("Retry-After", "")
+    if retry_after.isdigit():
+        return min(int(retry_after), RATE_LIMIT_MAX_BACKOFF)
+    return min(2 ** attempt + random.uniform(0, 1), RATE_LIMIT_MAX_BACKOFF)
+
+def record_already_exists(payload):
+    """Check whether a Cloudflare error response says the record already exists"""
+    return any(error.get("code") in RECORD_EXISTS_ERROR_CODES
+               for error in payload.get("errors") or ())
+
+def build_dns_record(record_type, name, content, ttl=1, priority=None):
+    """Build the Cloudflare payload for a DNS record
+
+    MX records take their priority from the priority argument, or, when it
+    is not given, from a "<priority> <server>" content string."""
+    data = {
+        "type": record_type,
+        "name": name,
+        "content": content,
+        "ttl": ttl
+    }
+    
+    # Handle MX records which need priority
+    if record_type == "MX":
+        if priority is not None:
+            data["priority"] = int(priority)
+        else:
+            parts = content.split(" ", 1)
+            if len(parts) == 2:
+                data["priority"] = int(parts[0])
+                data["content"] = parts[1]
+    return data
+
+def chunked(items, size):
+    """Yield successive lists of at most size items"""
+    it = iter(items)
+    return iter(lambda: list(islice(it, size)), [])
 
 class CloudflareClient:
     def __init__(self, api_key, email):
@@ -6,59 +135,152 @@ class CloudflareClient:
         self.email = email
         self.base_url = "https://api.cloudflare.com/client/v4"
 
+        # Endpoints, built once; zone-scoped ones take the zone ID via %
+        self._zones_url = self.base_url + "/zones"
+        self._zone_records_tmpl = self.base_url + "/zones/%s/dns_records"
+        self._zone_batch_tmpl = self.base_url + "/zones/%s/dns_records/batch"
+
+        # Calls go over the process-wide keep-alive pool
+        self.session = requests.Session()
+        self.session.headers.update({
+            "X-Auth-Email": email,
+            "X-Auth-Key": api_key,
+            "Content-Type": "application/json"
+        })
+        self.session.mount("https://", _adapter)
+
+        # Identifies the account in shared caches without keeping the key itself there
+        self._account = hashlib.sha256(api_key.encode()).hexdigest()
+        self._limiter = _account_limiter(self._account)
+
+        self._circuit = _account_circuit(self._account)
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Create a client from a utils.config.Config"""
+        return cls(cfg.cloudflare_api_key, cfg.cloudflare_email)
+
+    def _request(self, method, url, json=None, **kwargs):
+        """Send a request through the session once the rate limiter allows it
+
+        A json body is encoded with orjson; the session already sends the
+        application/json content type. Rate-limited responses are retried
+        with backoff, and CircuitOpenError is raised while the circuit
+        breaker is open."""
+        if json is not None:
+            kwargs["data"] = orjson.dumps(json)
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            self._check_circuit()
+            self._limiter.acquire()
+            response = self.session.request(method, url, **kwargs)
+            if not self._record_response(response):
+                return response
+            if attempt < RATE_LIMIT_RETRIES:
+                time.sleep(_rate_limit_backoff(attempt, response))
+        return response
+
+    def _check_circuit(self):
+        circuit = self._circuit
+        with circuit.lock:
+            remaining = circuit.open_until - time.monotonic()
+        if remaining > 0:
+            raise CircuitOpenError(
+                f"Cloudflare is rate limiting requests; retry in {remaining:.0f}s")
+
+    def _record_response(self, response):
+        """Update the circuit breaker; returns True if the response was rate limited"""
+        circuit = self._circuit
+        with circuit.lock:
+            if response.status_code != 429:
+                circuit.consecutive_429 = 0
+                return False
+            circuit.consecutive_429 += 1
+            if circuit.consecutive_429 >= CIRCUIT_BREAKER_THRESHOLD:
+                circuit.open_until = time.monotonic() + CIRCUIT_BREAKER_COOLDOWN
+                circuit.consecutive_429 = 0
+            return True
+
     def get_zone_id(self, zone_name):
         """Get the zone ID for a given domain"""
-        url = f"{self.base_url}/zones?name={zone_name}"
-        headers = {
-            "X-Auth-Email": self.email,
-            "X-Auth-Key": self.api_key,
-            "Content-Type": "application/json"
-        }
-        response = requests.get(url, headers=headers)
+        cache_key = (self._account, self.email, zone_name)
+        zone_id = _zone_cache.get(cache_key)
+        if zone_id is not None:
+            return zone_id
+
+        response = self._request("GET", self._zones_url, params={"name": zone_name})
         if response.status_code == 200:
             data = response.json()
             if data['result']:
-                return data['result'][0]['id']
+                zone_id = data['result'][0]['id']
+                _zone_cache.set(cache_key, zone_id)
+                return zone_id
         return None
 
     def check_zone_exists(self, zone_name):
         """Check if a zone exists in Cloudflare"""
         return self.get_zone_id(zone_name) is not None
 
-    def create_dns_record(self, zone_id, record_type, name, content, ttl=1):
-        """Create a DNS record in Cloudflare"""
-        url = f"{self.base_url}/zones/{zone_id}/dns_records"
-        headers = {
-            "X-Auth-Email": self.email,
-            "X-Auth-Key": self.api_key,
-            "Content-Type": "application/json"
-        }
-        data = {
-            "type": record_type,
-            "name": name,
-            "content": content,
-            "ttl": ttl
-        }
-        
-        # Handle MX records which need priority
-        if record_type == "MX":
-            parts = content.split(" ", 1)
-            if len(parts) == 2:
-                data["priority"] = int(parts[0])
-                data["content"] = parts[1]
-        
-        response = requests.post(url, json=data, headers=headers)
+    def create_dns_record(self, zone_id, record_type, name, content, ttl=1, priority=None):
+        """Create a DNS record in Cloudflare
+
+        MX records take their priority from the priority argument, or, when it
+        is not given, from a "<priority> <server>" content string."""
+        url = self._zone_records_tmpl % zone_id
+        data = build_dns_record(record_type, name, content, ttl, priority)
+        response = self._request("POST", url, json=data)
         return response.status_code == 200, response.json()
 
     def get_dns_records(self, zone_id):
-        """Get all DNS records for a zone"""
-        url = f"{self.base_url}/zones/{zone_id}/dns_records"
-        headers = {
-            "X-Auth-Email": self.email,
-            "X-Auth-Key": self.api_key,
-            "Content-Type": "application/json"
-        }
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            return response.json()['result']
-        return []
\ No newline at end of file
+        """Get all DNS records for a zone, following pagination"""
+        url = self._zone_records_tmpl % zone_id
+        records = []
+        page = 1
+        while True:
+            response = self._request("GET", url, params={"page": page, "per_page": 1000})
+            if response.status_code != 200:
+                return records
+            data = response.json()
+            records.extend(data['result'])
+            if page >= (data.get('result_info') or {}).get('total_pages', 1):
+                return records
+            page += 1
+
+    def create_dns_records_batch(self, zone_id, records, ttl=1):
+        """Create DNS records, given as dicts with type, name and value, in one batch
+
+        Returns (success, response) like batch_dns_records; on success the
+        created records are in response['result']['posts'], in input order."""
+        posts = [build_dns_record(record['type'], record['name'], record['value'], ttl,
+                                  record.get('priority'))
+                 for record in records]
+        return self.batch_dns_records(zone_id, posts=posts)
+
+    def batch_dns_records(self, zone_id, posts=None, patches=None, puts=None, deletes=None):
+        """Apply several DNS record changes to a zone using as few requests as possible
+
+        Changes are split into batches of at most BATCH_SIZE operations. On
+        success the per-operation results of all batches are merged; if a
+        batch fails, its error response is returned and later batches are not
+        sent.
+        """
+        url = self._zone_batch_tmpl % zone_id
+        operations = [(operation, record)
+                      for operation, records in (("deletes", deletes), ("patches", patches),
+                                                 ("puts", puts), ("posts", posts))
+                      for record in records or ()]
+
+        result = {"deletes": [], "patches": [], "puts": [], "posts": []}
+        for chunk in chunked(operations, BATCH_SIZE):
+            data = {}
+            for operation, record in chunk:
+                data.setdefault(operation, []).append(record)
+
+            response = self._request("POST", url, json=data)
+            if response.status_code != 200:
+                return False, response.json()
+            for operation, records in (response.json().get("result") or {}).items():
+                result.setdefault(operation, []).extend(records)
+
+        return True, {"success": True, "errors": [], "messages": [], "result": result}
@@ -1,99 +1,135 @@
+import logging
 import requests
-import base64
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from api import REQUEST_TIMEOUT
+from utils.cache import TTLCache
+
+# Connection pool shared by every client's session, so connections outlive
+# the per-request clients created by the app. Auth is set per session.
+_adapter = HTTPAdapter(
+    pool_connections=1, pool_maxsize=20,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504],
+                      respect_retry_after_header=True, raise_on_status=False))
+
+logger = logging.getLogger(__name__)
+
+# Status codes Mailgun answers a create with when the domain already exists
+CONFLICT_STATUS_CODES = frozenset({400, 409})
 
 class MailgunClient:
-    def __init__(self, api_key):
+    def __init__(self, api_key, cache_ttl=300):
         self.api_key = api_key
         self.base_url = "https://api.mailgun.net/v3"
+
+        # Endpoints, built once; domain-scoped ones take the domain name via %
+        self._domains_url = self.base_url + "/domains"
+        self._domain_tmpl = self.base_url + "/domains/%s"
+        self._domain_verify_tmpl = self.base_url + "/domains/%s/verify"
+
+        # Calls go over the process-wide keep-alive pool
+        self.session = requests.Session()
+        self.session.auth = ('api', api_key)
+        self.session.mount("https://", _adapter)
+
+        # Successful get_domain responses, keyed by domain name
+        self._domain_cache = TTLCache(cache_ttl)
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Create a client from a utils.config.Config"""
+        return cls(cfg.mailgun_api_key)
+
+    def _request(self, method, url, **kwargs):
+        """Send a request through the session with the default timeout"""
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+        return self.session.request(method, url, **kwargs)
         
-    def create_domain(self, domain_name):
-        """Create a new domain in Mailgun"""
-        url = f"{self.base_url}/domains"
-        auth = ('api', self.api_key)
-        data = {
-            'name': domain_name,
-            'smtp_password': 'supersecretpassword123',  # You might want to generate this
-        }
+    def create_domain(self, domain_name, smtp_password='supersecretpassword123'):
+        """Create a new domain in Mailgun
+
+        Pass smtp_password=None to leave the SMTP credentials to Mailgun. On
+        failure the response also carries the HTTP status as 'status_code',
+        so callers can tell a conflict (CONFLICT_STATUS_CODES) from other
+        errors."""
+        url = self._domains_url
+        data = {'name': domain_name}
+        if smtp_password is not None:
+            data['smtp_password'] = smtp_password  # You might want to generate this
         
-        response = requests.post(url, auth=auth, data=data)
-        return response.status_code == 200, response.json()
+        response = self._request("POST", url, data=data)
+        result = response.json()
+        if response.status_code != 200:
+            result['status_code'] = response.status_code
+        return response.status_code == 200, result
     
     def get_domain(self, domain_name):
         """Get domain information from Mailgun"""
-        url = f"{self.base_url}/domains/{domain_name}"
-        auth = ('api', self.api_key)
-        
+        cached = self._domain_cache.get(domain_name)
+        if cached is not None:
+            return True, cached
+
+        url = self._domain_tmpl % domain_name
         try:
-            response = requests.get(url, auth=auth)
+            response = self._request("GET", url)
             if response.status_code == 200:
-                return True, response.json()
+                data = response.json()
+                self._domain_cache.set(domain_name, data)
+                return True, data
             else:
-                print(f"Mailgun API error for domain {domain_name}: {response.status_code} - {response.text}")
+                # A missing domain is expected while probing domain variants
+                level = logging.DEBUG if response.status_code == 404 else logging.WARNING
+                logger.log(level, "Mailgun API error for domain %s: %s - %s",
+                           domain_name, response.status_code, response.text)
                 return False, {"error": response.text}
         except Exception as e:
-            print(f"Exception when getting domain {domain_name}: {str(e)}")
+            logger.warning("Exception when getting domain %s: %s", domain_name, e)
             return False, {"error": str(e)}
     
     def list_domains(self):
         """List all domains in the Mailgun account"""
-        url = f"{self.base_url}/domains"
-        auth = ('api', self.api_key)
-        
+        url = self._domains_url
         try:
-            response = requests.get(url, auth=auth)
+            response = self._request("GET", url)
             if response.status_code == 200:
                 return True, response.json()
             else:
-                print(f"Mailgun API error listing domains: {response.status_code} - {response.text}")
+                logger.warning("Mailgun API error listing domains: %s - %s", response.status_code, response.text)
                 return False, {"error": response.text}
         except Exception as e:
-            print(f"Exception when listing domains: {str(e)}")
+            logger.warning("Exception when listing domains: %s", e)
             return False, {"error": str(e)}
     
     def get_domain_dns_records(self, domain):
         """Get the DNS records for a domain from Mailgun
-        Returns (success: bool, dns_records: dict)"""
-        try:
-            print(f"Attempting to get DNS records for domain: {domain}")
-            url = f"{self.api_base}/domains/{domain}"
-            
-            response = requests.get(url, auth=('api', self.api_key), timeout=30)
-            print(f"Mailgun API response status: {response.status_code}")
-            
-            if response.status_code == 200:
-                data = response.json()
-                print(f"Received data keys: {list(data.keys()) if data else 'No data'}")
-                
-                if 'domain' in data:
-                    domain_info = data['domain']
-                    dns_records = {
-                        'mx': domain_info.get('mx_records', []),
-                        'txt': domain_info.get('txt_records', []),
-                        'cname': domain_info.get('cname_records', [])
-                    }
-                    print(f"DNS records found - MX: {len(dns_records['mx'])}, TXT: {len(dns_records['txt'])}, CNAME: {len(dns_records['cname'])}")
-                    return True, dns_records
-                else:
-                    print("No 'domain' key in response data")
-                    return False, {}
-            elif response.status_code == 404:
-                print(f"Domain {domain} not found in Mailgun (404)")
-                return False, {}
-            else:
-                print(f"Error getting domain DNS records: {response.status_code} - {response.text}")
-                return False, {}
-                
-        except requests.exceptions.RequestException as e:
-            print(f"Request exception getting domain DNS records: {str(e)}")
-            return False, {}
-        except Exception as e:
-            print(f"Unexpected error getting domain DNS records: {str(e)}")
-            return False, {}
+        Returns (success: bool, dns_records: list of dicts with type, name and value)"""
+        logger.debug("Attempting to get DNS records for domain: %s", domain)
+        # Shares the cached get_domain response, so no extra round trip when it was already fetched
+        success, data = self.get_domain(domain)
+        if not success:
+            return False, []
+
+        dns_records = []
+        for record in data.get('sending_dns_records', []):
+            dns_records.append({
+                'type': record.get('record_type'),
+                'name': record.get('name'),
+                'value': record.get('value'),
+            })
+        for record in data.get('receiving_dns_records', []):
+            # Receiving (MX) records apply to the domain itself and carry their priority separately
+            dns_records.append({
+                'type': record.get('record_type'),
+                'name': domain,
+                'value': f"{record.get('priority', 10)} {record.get('value')}",
+            })
+
+        logger.debug("DNS records found: %d", len(dns_records))
+        return True, dns_records
     
     def verify_domain(self, domain_name):
         """Verify domain DNS settings"""
-        url = f"{self.base_url}/domains/{domain_name}/verify"
-        auth = ('api', self.api_key)
+        url = self._domain_verify_tmpl % domain_name
         
-        response = requests.put(url, auth=auth)
+        response = self._request("PUT", url)
         return response.status_code == 200, response.json()
@@ -1,41 +1,100 @@
-from flask import Flask, render_template, request, jsonify, flash, redirect, url_for
+import os
+
+if os.environ.get('GEVENT_MONKEY_PATCH') == '1':
+    # Must run before requests/ssl are imported so outbound API calls yield to
+    # other greenlets instead of blocking the worker
+    from gevent import monkey
+    monkey.patch_all()
+
+from flask import Flask, render_template, request, jsonify, flash, redirect, url_for, session
 # from utils.config import load_config
-from api.cloudflare_client import CloudflareClient
+from api.cloudflare_client import CloudflareClient, MAX_CONNECTIONS, record_already_exists
 from api.mailgun_client import MailgunClient
-import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from utils.cache import TTLCache
+from utils.json_provider import OrjsonProvider
+from functools import lru_cache
+from types import MappingProxyType
+import hashlib
+import logging
 import secrets
+import threading
+
+# Debug output (e.g. Mailgun domain lookups) is only logged in development
+logging.basicConfig(
+    level=logging.DEBUG if os.environ.get('FLASK_ENV') == 'development' else logging.INFO,
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # Security configuration
-secret_key = os.environ.get('SECRET_KEY')
-if not secret_key or secret_key == 'dev-secret-key-change-in-production':
-    if os.environ.get('FLASK_ENV') == 'development':
-        secret_key = 'dev-secret-key-change-in-production'
-    else:
-        # Generate a random secret key for production if none provided
-        secret_key = secrets.token_hex(32)
-        print("WARNING: No SECRET_KEY environment variable set. Generated random key.")
+DEV_SECRET_KEY = 'dev-secret-key-change-in-production'
+if os.environ.get('FLASK_ENV') == 'development':
+    app.secret_key = os.environ.get('SECRET_KEY') or DEV_SECRET_KEY
+else:
+    if os.environ.get('SECRET_KEY') in (None, '', DEV_SECRET_KEY):
+        # Generate a random secret key for production if none provided. It is
+        # put in the environment so Gunicorn started from __main__ (and its
+        # workers) reuse this key instead of each generating their own.
+        os.environ['SECRET_KEY'] = secrets.token_hex(32)
+        logger.warning("No SECRET_KEY environment variable set. Generated random key.")
+    app.secret_key = os.environ['SECRET_KEY']
+
+# Credentials entered on the setup form, kept server-side and looked up by a
+# short random token so they never appear in URLs or page source
+SETUP_STATE = TTLCache(ttl=600, maxsize=1024)
 
-app.secret_key = secret_key
+def save_setup_state(**state):
+    token = secrets.token_urlsafe(16)
+    SETUP_STATE.set(token, state)
+    return token
 
 # Security headers
+_SEC_HEADERS = (
+    ('X-Content-Type-Options', 'nosniff'),
+    ('X-Frame-Options', 'DENY'),
+    ('X-XSS-Protection', '1; mode=block'),
+    ('Referrer-Policy', 'strict-origin-when-cross-origin'),
+    ('Content-Security-Policy', "default-src 'self' 'unsafe-inline' 'unsafe-eval'; img-src 'self' data:; font-src 'self' data:;"),
+)
+
+# Framing, XSS and CSP rules only matter to pages a browser renders; JSON
+# responses just need sniffing disabled
+_JSON_SEC_HEADERS = (('X-Content-Type-Options', 'nosniff'),)
+
 @app.after_request
 def security_headers(response):
-    response.headers['X-Content-Type-Options'] = 'nosniff'
-    response.headers['X-Frame-Options'] = 'DENY'
-    response.headers['X-XSS-Protection'] = '1; mode=block'
-    response.headers['Referrer-Policy'] = 'strict-origin-when-cross-origin'
-    response.headers['Content-Security-Policy'] = "default-src 'self' 'unsafe-inline' 'unsafe-eval'; img-src 'self' data:; font-src 'self' data:;"
+    # update() replaces existing values, like the item assignments it stands in for
+    if response.mimetype == 'application/json':
+        response.headers.update(_JSON_SEC_HEADERS)
+    else:
+        response.headers.update(_SEC_HEADERS)
     return response
 
+# Pages that look the same for every visitor are rendered once per process
+_static_pages = {}
+
+def render_static_page(template_name):
+    """Render a context-free template, reusing the HTML from earlier requests
+
+    Pending flash messages are part of the page, so those renders bypass
+    the cache, as do all renders in debug mode where templates reload."""
+    if app.debug or '_flashes' in session:
+        return render_template(template_name)
+    html = _static_pages.get(template_name)
+    if html is None:
+        html = _static_pages[template_name] = render_template(template_name)
+    return html
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_static_page('index.html')
 
 @app.route('/security-verification')
 def security_verification():
-    return render_template('security_verification.html')
+    return render_static_page('security_verification.html')
 
 @app.route('/setup', methods=['GET', 'POST'])
 def setup():
@@ -57,17 +116,16 @@ def setup():
             
             if zone_id:
                 # Zone found, proceed with automatic setup
-                return redirect(url_for('automatic_setup', 
-                                      domain=domain, 
-                                      mailgun_api_key=mailgun_api_key,
-                                      cloudflare_api_key=cloudflare_api_key,
-                                      cloudflare_email=cloudflare_email,
-                                      zone_id=zone_id))
+                token = save_setup_state(domain=domain,
+                                         mailgun_api_key=mailgun_api_key,
+                                         cloudflare_api_key=cloudflare_api_key,
+                                         cloudflare_email=cloudflare_email,
+                                         zone_id=zone_id)
+                return redirect(url_for('automatic_setup', token=token))
             else:
                 # Zone not found, show manual entry
-                return redirect(url_for('manual_setup', 
-                                      domain=domain, 
-                                      mailgun_api_key=mailgun_api_key))
+                token = save_setup_state(domain=domain, mailgun_api_key=mailgun_api_key)
+                return redirect(url_for('manual_setup', token=token))
                 
         except Exception as e:
             flash(f'Error connecting to Cloudflare: {str(e)}', 'error')
@@ -77,23 +135,99 @@ def setup():
 
 @app.route('/automatic-setup')
 def automatic_setup():
-    domain = request.args.get('domain')
-    mailgun_api_key = request.args.get('mailgun_api_key')
-    cloudflare_api_key = request.args.get('cloudflare_api_key')
-    cloudflare_email = request.args.get('cloudflare_email')
-    zone_id = request.args.get('zone_id')
+    token = request.args.get('token')
+    state = SETUP_STATE.get(token) if token else None
+    if state is None:
+        flash('Your setup session has expired, please enter your details again', 'error')
+        return redirect(url_for('setup'))
     
-    return render_template('automatic_setup.html', 
-                         domain=domain,
-                         mailgun_api_key=mailgun_api_key,
-                         cloudflare_api_key=cloudflare_api_key,
-                         cloudflare_email=cloudflare_email,
-                         zone_id=zone_id)
+    return render_template('automatic_setup.html', domain=state['domain'], token=token)
+
+# Successful setup results by idempotency key, replayed to duplicate submits.
+# Entries are (request fingerprint, payload).
+IDEMPOTENCY = TTLCache(ttl=300, maxsize=4096)
+
+# Setups still running, so a concurrent duplicate waits for the first one.
+# Entries are (request fingerprint, Future).
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+# Setup fields that identify whose setup a request is
+_SETUP_OWNER_FIELDS = ('mailgun_api_key', 'cloudflare_api_key', 'cloudflare_email', 'domain')
+_SETUP_FIELDS = _SETUP_OWNER_FIELDS + ('zone_id',)
+
+def _fingerprint(data, fields):
+    """Hash the given fields of a request, so caches never hold the credentials themselves"""
+    return hashlib.sha256('\0'.join(str(data.get(f) or '') for f in fields).encode()).hexdigest()
+
+def run_idempotent(key, fingerprint, func, *args):
+    """Run func(*args) once per key and share its result with duplicate calls
+
+    Successful results are replayed for IDEMPOTENCY's TTL; failures are not
+    kept so the caller can try again. A duplicate whose fingerprint differs
+    from the first request's is rejected rather than given its result."""
+    with _in_flight_lock:
+        entry = IDEMPOTENCY.get(key) or _in_flight.get(key)
+        if entry is None:
+            future = Future()
+            _in_flight[key] = (fingerprint, future)
+    if entry is not None:
+        stored_fingerprint, result = entry
+        if stored_fingerprint != fingerprint:
+            return {'success': False, 'error': 'Idempotency-Key was already used for a different request'}
+        return result.result() if isinstance(result, Future) else result
+
+    try:
+        payload = func(*args)
+        if payload.get('success'):
+            IDEMPOTENCY.set(key, (fingerprint, payload))
+        future.set_result(payload)
+        return payload
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
 
 @app.route('/api/perform-automatic-setup', methods=['POST'])
 def perform_automatic_setup():
-    """API endpoint to perform the actual automatic setup"""
+    """API endpoint to perform the actual automatic setup
+
+    Requests with the same setup token, or with the same Idempotency-Key
+    header and credentials, run the setup once and all get its result."""
     data = request.json
+    token = data.get('token')
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if token:
+        # Tokens are random and bound to the credentials saved with them
+        key, fingerprint = ('token', token), None
+        setup, arg = run_token_setup, token
+    elif idempotency_key:
+        # Scope client-chosen keys to the caller, so another account sending
+        # the same key can't read this setup's result
+        key = ('key', _fingerprint(data, _SETUP_OWNER_FIELDS), idempotency_key)
+        fingerprint = _fingerprint(data, _SETUP_FIELDS)
+        setup, arg = run_automatic_setup, data
+    else:
+        return jsonify(run_automatic_setup(data))
+    return jsonify(run_idempotent(key, fingerprint, setup, arg))
+
+def run_token_setup(token):
+    """Run the setup with the credentials saved by the setup form under token
+
+    The token is only used up once the setup succeeds, so a failed run can
+    be retried with it."""
+    state = SETUP_STATE.get(token)
+    if state is None:
+        return {'success': False, 'error': 'Setup session expired, please start again'}
+    payload = run_automatic_setup(state)
+    if payload.get('success'):
+        SETUP_STATE.pop(token)
+    return payload
+
+def run_automatic_setup(data):
+    """Create the Mailgun domain and its Cloudflare records, returning the response payload"""
     domain = data.get('domain')
     mailgun_api_key = data.get('mailgun_api_key')
     cloudflare_api_key = data.get('cloudflare_api_key')
@@ -110,48 +244,93 @@ def perform_automatic_setup():
         success, domain_info = mg_client.create_domain(mailgun_domain)
         
         if not success:
-            return jsonify({'success': False, 'error': 'Failed to create Mailgun domain'})
+            return {'success': False, 'error': 'Failed to create Mailgun domain'}
         
         # Get DNS records
         success, dns_records = mg_client.get_domain_dns_records(mailgun_domain)
         
         if not success:
-            return jsonify({'success': False, 'error': 'Failed to get DNS records'})
+            return {'success': False, 'error': 'Failed to get DNS records'}
         
-        # Create DNS records in Cloudflare
-        created_records = []
-        for record in dns_records:
-            success, result = cf_client.create_dns_record(
-                zone_id, 
-                record['type'], 
-                record['name'], 
-                record['value']
-            )
-            created_records.append({
-                'record': record,
-                'success': success,
-                'result': result
-            })
+        # Create DNS records in Cloudflare with a single batch request
+        success, result = cf_client.create_dns_records_batch(zone_id, dns_records)
+        if success:
+            created_records = [
+                {
+                    'record': record,
+                    'success': True,
+                    'result': {'success': True, 'errors': [], 'messages': [], 'result': created}
+                }
+                for record, created in zip(dns_records, result['result']['posts'])
+            ]
+        elif record_already_exists(result):
+            # Cloudflare rejects the whole batch if one record already exists, so
+            # fall back to creating them one by one
+            created_records = create_dns_records(cf_client, zone_id, dns_records)
+        else:
+            # Anything else (bad credentials, outages) would fail every single
+            # create the same way, so report it instead of retrying per record
+            errors = '; '.join(e.get('message', str(e)) for e in result.get('errors') or ())
+            return {'success': False, 'error': f"Cloudflare rejected the DNS records: {errors or result}"}
         
-        return jsonify({
+        return {
             'success': True, 
             'domain_info': domain_info,
             'dns_records': created_records
-        })
+        }
         
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
+        return {'success': False, 'error': str(e)}
+
+def create_dns_records(cf_client, zone_id, dns_records):
+    """Create DNS records in Cloudflare concurrently, returning results in record order"""
+    def create(record):
+        try:
+            success, result = cf_client.create_dns_record(
+                zone_id, 
+                record['type'], 
+                record['name'], 
+                record['value']
+            )
+        except Exception as e:
+            success, result = False, {'error': str(e)}
+        return {
+            'record': record,
+            'success': success,
+            'result': result
+        }
+
+    # The client's connection pool bounds how many requests are in flight at once
+    with ThreadPoolExecutor(max_workers=MAX_CONNECTIONS) as executor:
+        return list(executor.map(create, dns_records))
 
 @app.route('/manual-setup')
 def manual_setup():
-    domain = request.args.get('domain')
-    mailgun_api_key = request.args.get('mailgun_api_key')
+    # Left in place until it expires, so the page can be reloaded while the
+    # records are copied into the DNS provider
+    token = request.args.get('token')
+    state = SETUP_STATE.get(token) if token else None
+    if state is None:
+        flash('Your setup session has expired, please enter your details again', 'error')
+        return redirect(url_for('setup'))
+    domain = state['domain']
     
     # Get DNS records from Mailgun API
-    dns_records = get_mailgun_dns_records(domain, mailgun_api_key)
+    dns_records = get_mailgun_dns_records(domain, state['mailgun_api_key'])
     
     return render_template('manual_setup.html', domain=domain, dns_records=dns_records)
 
+# Forms a Mailgun domain may take for an entered domain, in order of preference:
+# exactly as entered, then with the mg., mail. and email. prefixes
+_DOMAIN_PREFIXES = ('', 'mg.', 'mail.', 'email.')
+
+def _domain_variants(domain, known_domains=None):
+    """Yield the Mailgun domain variants for domain, limited to known_domains if given"""
+    for prefix in _DOMAIN_PREFIXES:
+        variant = prefix + domain
+        if known_domains is None or variant in known_domains:
+            yield variant
+
 def get_mailgun_dns_records(domain, api_key):
     """Get the required DNS records from Mailgun API"""
     try:
@@ -159,71 +338,88 @@ def get_mailgun_dns_records(domain, api_key):
         
         # List all domains to help with debugging
         success, domains_info = mg_client.list_domains()
+        known_domains = None
         if success and 'items' in domains_info:
-            print(f"Available domains in Mailgun account:")
-            for domain_item in domains_info['items']:
-                print(f"  - {domain_item.get('name', 'Unknown')}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Available domains in Mailgun account: %s",
+                             ', '.join(d.get('name', 'Unknown') for d in domains_info['items']))
+            # Only trust the list to rule variants out if it covers the whole account
+            items = domains_info['items']
+            if domains_info.get('total_count', len(items)) <= len(items):
+                known_domains = {domain_item.get('name') for domain_item in items}
         
-        # Try different domain formats
-        domain_variants = [
-            domain,                    # exactly as entered
-            f"mg.{domain}",           # with mg. prefix  
-            f"mail.{domain}",         # with mail. prefix
-            f"email.{domain}",        # with email. prefix
-        ]
+        if known_domains is not None:
+            # The account's domains are known, so only look up variants it has,
+            # in order of preference, stopping at the first with records
+            domain_variants = _domain_variants(domain, known_domains)
+            results = ((v, mg_client.get_domain_dns_records(v)) for v in domain_variants)
+        else:
+            domain_variants = list(_domain_variants(domain))
+            # Variants are independent lookups, so overlap their round trips
+            with ThreadPoolExecutor(max_workers=len(domain_variants)) as executor:
+                results = zip(domain_variants,
+                              list(executor.map(mg_client.get_domain_dns_records, domain_variants)))
         
-        for domain_variant in domain_variants:
-            print(f"Trying domain variant: {domain_variant}")
-            success, dns_records = mg_client.get_domain_dns_records(domain_variant)
-            
+        for domain_variant, (success, dns_records) in results:
             if success and dns_records:
-                print(f"Successfully found DNS records for: {domain_variant}")
+                logger.debug("Successfully found DNS records for: %s", domain_variant)
                 return dns_records
             elif success:
-                print(f"Domain {domain_variant} found but no DNS records returned")
+                logger.debug("Domain %s found but no DNS records returned", domain_variant)
         
-        print("No domain variants worked, returning fallback records")
+        logger.info("No domain variants worked for %s, returning fallback records", domain)
         return get_fallback_dns_records(domain)
             
     except Exception as e:
-        print(f"Exception in get_mailgun_dns_records: {str(e)}")
+        logger.exception("Exception in get_mailgun_dns_records: %s", e)
         # Return fallback records if there's an error
         return get_fallback_dns_records(domain)
 
+# Mailgun's standard record set; names are templates filled in with the domain
+FALLBACK_DNS_RECORDS = (
+    {
+        'type': 'TXT',
+        'name': 'mg.{domain}',
+        'value': 'v=spf1 include:mailgun.org ~all',
+        'description': 'SPF Record'
+    },
+    {
+        'type': 'TXT', 
+        'name': 'krs._domainkey.mg.{domain}',
+        'value': 'k=rsa; p=MIGfMA0GCSqGSIb3DQEBAQUAA4GNADCBiQKBgQC...(contact Mailgun for actual DKIM key)',
+        'description': 'DKIM Record'
+    },
+    {
+        'type': 'CNAME',
+        'name': 'email.mg.{domain}',
+        'value': 'mailgun.org',
+        'description': 'Tracking Record'
+    },
+    {
+        'type': 'MX',
+        'name': 'mg.{domain}',
+        'value': '10 mxa.mailgun.org',
+        'description': 'MX Record'
+    },
+    {
+        'type': 'MX',
+        'name': 'mg.{domain}',
+        'value': '10 mxb.mailgun.org',
+        'description': 'MX Record (Backup)'
+    }
+)
+
+@lru_cache(maxsize=512)
+def _fallback_dns_records(domain):
+    return tuple(
+        MappingProxyType(dict(record, name=record['name'].format(domain=domain)))
+        for record in FALLBACK_DNS_RECORDS
+    )
+
 def get_fallback_dns_records(domain):
     """Fallback DNS records if Mailgun API is not available"""
-    return [
-        {
-            'type': 'TXT',
-            'name': f'mg.{domain}',
-            'value': 'v=spf1 include:mailgun.org ~all',
-            'description': 'SPF Record'
-        },
-        {
-            'type': 'TXT', 
-            'name': f'krs._domainkey.mg.{domain}',
-            'value': 'k=rsa; p=MIGfMA0GCSqGSIb3DQEBAQUAA4GNADCBiQKBgQC...(contact Mailgun for actual DKIM key)',
-            'description': 'DKIM Record'
-        },
-        {
-            'type': 'CNAME',
-            'name': f'email.mg.{domain}',
-            'value': 'mailgun.org',
-            'description': 'Tracking Record'
-        },
-        {
-            'type': 'MX',
-            'name': f'mg.{domain}',
-            'value': '10 mxa.mailgun.org',
-            'description': 'MX Record'
-        },
-        {
-            'type': 'MX',
-            'name': f'mg.{domain}',
-            'value': '10 mxb.mailgun.org',
-            'description': 'MX Record (Backup)'
-        }
-    ]
+    # The cached records are read-only; callers get their own copies
+    return [dict(record) for record in _fallback_dns_records(domain)]
 
 if __name__ == "__main__":
     # Get configuration from environment variables
@@ -231,4 +427,19 @@ if __name__ == "__main__":
     port = int(os.environ.get('PORT', 5000))
     host = os.environ.get('HOST', '0.0.0.0')
     
-    app.run(debug=debug, host=host, port=port)
\ No newline at end of file
+    if debug:
+        app.run(debug=debug, host=host, port=port)
+    else:
+        # The Flask server handles one request at a time; hand the process to
+        # Gunicorn's gevent worker instead. One worker, since setup tokens are
+        # kept in process memory.
+        # The app is preloaded before patching would normally happen, so ask
+        # main.py to monkey-patch on import
+        os.environ.setdefault('GEVENT_MONKEY_PATCH', '1')
+        try:
+            os.execvp('gunicorn', ['gunicorn', '--worker-class', 'gevent', '--workers', '1',
+                                   '--worker-connections', '1000', '--preload', '--bind', f'{host}:{port}',
+                                   '--chdir', os.path.dirname(os.path.abspath(__file__)), 'main:app'])
+        except FileNotFoundError:
+            logger.warning("gunicorn not found, falling back to the Flask development server.")
+            app.run(debug=debug, host=host, port=port)
\ No newline at end of file
@@ -1,13 +1,32 @@
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+_VALID_TYPES = frozenset({'A', 'AAAA', 'CNAME', 'MX', 'TXT', 'SRV', 'NS', 'CAA'})
+_NAME_RE = re.compile(r'[A-Za-z0-9_.-]{1,253}')
+
+@dataclass(frozen=True, init=False)
 class DNSRecord:
-    def __init__(self, name, record_type, content):
-        self.name = name
-        self.type = record_type
-        self.content = content
+    # Declared by hand rather than with slots=True so Python 3.9 is still supported
+    __slots__ = ('name', 'type', 'content', 'priority')
+
+    name: str
+    type: str
+    content: str
+    priority: Optional[int]
+
+    def __init__(self, name, record_type, content, priority=None):
+        # A class-level default would clash with the slot, so the optional
+        # priority is handled here; frozen instances are set via object
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'type', record_type)
+        object.__setattr__(self, 'content', content)
+        object.__setattr__(self, 'priority', priority)
 
     def validate(self):
         if not self.name or not self.type or not self.content:
             raise ValueError("All fields (name, type, content) must be provided.")
-        # Additional validation logic can be added here
-
-    def __repr__(self):
-        return f"DNSRecord(name={self.name}, type={self.type}, content={self.content})"
\ No newline at end of file
+        if self.type not in _VALID_TYPES:
+            raise ValueError(f"Unsupported DNS record type: {self.type}")
+        if not _NAME_RE.fullmatch(self.name):
+            raise ValueError(f"Invalid DNS record name: {self.name}")
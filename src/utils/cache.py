@@ -0,0 +1,56 @@
+import threading
+import time
+
+class TTLCache:
+    """A small thread-safe mapping whose entries expire after ``ttl`` seconds.
+
+    When ``maxsize`` entries are stored, the oldest entry is evicted to make
+    room for a new one.
+    """
+
+    def __init__(self, ttl, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        """Store value under key for ``ttl`` seconds"""
+        with self._lock:
+            self._data.pop(key, None)
+            if len(self._data) >= self.maxsize:
+                del self._data[next(iter(self._data))]
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def pop(self, key, default=None):
+        """Remove key and return its value, or default if missing or expired"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None or entry[0] <= time.monotonic():
+                return default
+            return entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+_MISSING = object()
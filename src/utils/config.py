@@ -1,15 +1,48 @@
+import os
+import re
+from dataclasses import dataclass
+
+# (Config field, environment variable, prompt label)
+_CREDENTIALS = (
+    ('mailgun_api_key', 'MAILGUN_API_KEY', 'Mailgun API Key'),
+    ('cloudflare_api_key', 'CLOUDFLARE_API_KEY', 'Cloudflare API Key'),
+    ('cloudflare_email', 'CLOUDFLARE_EMAIL', 'Cloudflare Email'),
+)
+
+@dataclass(frozen=True)
+class Config:
+    """API credentials shared by the Mailgun and Cloudflare clients."""
+    __slots__ = ('mailgun_api_key', 'cloudflare_api_key', 'cloudflare_email')
+
+    mailgun_api_key: str
+    cloudflare_api_key: str
+    cloudflare_email: str
+
+    @classmethod
+    def load(cls, environ=os.environ, prompt=input):
+        """Read the credentials from the environment once, prompting for any that are missing."""
+        values = {}
+        for field_name, env_var, label in _CREDENTIALS:
+            value = environ.get(env_var)
+            if value:
+                print(f"✓ {label} found in environment variables.")
+            else:
+                print(f"✗ {label} not found. Please provide it.")
+                value = prompt(f"Enter your {label}: ")
+            values[field_name] = value
+        return cls(**values)
+
+# KEY=value lines; comments, blank lines and anything else never match
+_ENV_RE = re.compile(r'(?m)^[ \t]*([A-Za-z_][A-Za-z0-9_]*)[ \t]*=[ \t]*(.*?)[ \t\r]*$')
+
 def load_config(env_file='.env'):
     """Load configuration from a .env file."""
-    config = {}
     try:
         with open(env_file) as f:
-            for line in f:
-                if line.strip() and not line.startswith('#'):
-                    key, value = line.strip().split('=', 1)
-                    config[key] = value
+            return dict(_ENV_RE.findall(f.read()))
     except FileNotFoundError:
         print(f"Warning: {env_file} not found. Using default configuration.")
-    return config
+    return {}
 
 def get_api_keys(config):
     """Retrieve API keys from the configuration."""
@@ -0,0 +1,29 @@
+import threading
+import time
+
+class RateLimiter:
+    """A thread-safe token bucket allowing ``rate`` calls every ``per`` seconds.
+
+    Up to ``rate`` calls may happen back to back; after that, ``acquire``
+    sleeps until the bucket has refilled enough for the next call.
+    """
+
+    def __init__(self, rate, per=1.0):
+        self.rate = rate
+        self.per = per
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call is allowed under the rate limit"""
+        with self._lock:
+            now = time.monotonic()
+            refill = (now - self._updated) * self.rate / self.per
+            self._tokens = min(self.rate, self._tokens + refill)
+            self._updated = now
+            # Going negative reserves a future slot, so concurrent callers queue up in order
+            self._tokens -= 1
+            delay = -self._tokens * self.per / self.rate if self._tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
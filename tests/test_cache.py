@@ -0,0 +1,42 @@
+# Tests for the in-process TTL cache used by the API clients
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from utils import cache
+from utils.cache import TTLCache
+
+def test_set_and_get():
+    """Test that stored values are returned until they expire"""
+    ttl_cache = TTLCache(ttl=60)
+    ttl_cache.set('example.com', 'zone-id')
+    assert ttl_cache.get('example.com') == 'zone-id'
+    assert 'example.com' in ttl_cache
+    assert ttl_cache.get('missing.com') is None
+
+def test_expired_entries_are_dropped(monkeypatch):
+    """Test that entries are not returned after their TTL has passed"""
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    ttl_cache = TTLCache(ttl=10)
+    ttl_cache.set('example.com', 'zone-id')
+    now[0] += 11
+    assert ttl_cache.get('example.com') is None
+    assert len(ttl_cache) == 0
+
+def test_oldest_entry_evicted_when_full():
+    """Test that the oldest entry makes room once maxsize is reached"""
+    ttl_cache = TTLCache(ttl=60, maxsize=2)
+    ttl_cache.set('a', 1)
+    ttl_cache.set('b', 2)
+    ttl_cache.set('c', 3)
+    assert 'a' not in ttl_cache
+    assert ttl_cache.get('b') == 2
+    assert ttl_cache.get('c') == 3
+
+def test_pop_removes_entry():
+    """Test that pop returns the value once and removes it"""
+    ttl_cache = TTLCache(ttl=60)
+    ttl_cache.set('token', {'domain': 'example.com'})
+    assert ttl_cache.pop('token') == {'domain': 'example.com'}
+    assert ttl_cache.pop('token') is None
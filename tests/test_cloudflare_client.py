@@ -0,0 +1,218 @@
+# Tests for CloudflareClient request handling, with the HTTP session stubbed out
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from unittest.mock import Mock
+
+import orjson
+
+from api import cloudflare_client
+import pytest
+
+from api import REQUEST_TIMEOUT
+from api.cloudflare_client import CircuitOpenError, CloudflareClient, chunked, record_already_exists
+
+def make_response(status_code, payload):
+    response = Mock(status_code=status_code, headers={})
+    response.json.return_value = payload
+    return response
+
+def sent_json(call):
+    return orjson.loads(call.kwargs['data'])
+
+def make_client(*responses):
+    cloudflare_client._zone_cache.clear()
+    cloudflare_client._circuits.clear()
+    client = CloudflareClient('cf-key', 'admin@example.com')
+    client._limiter = Mock()
+    client.session = Mock()
+    client.session.request.side_effect = list(responses)
+    return client
+
+def test_chunked():
+    """Test that items are split into lists of at most the given size"""
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked([], 2)) == []
+
+def test_batch_dns_records_splits_into_chunks(monkeypatch):
+    """Test that large batches are sent in BATCH_SIZE chunks and results merged"""
+    monkeypatch.setattr(cloudflare_client, 'BATCH_SIZE', 2)
+    posts = [{'type': 'TXT', 'name': f'r{i}.example.com', 'content': 'x'} for i in range(3)]
+    client = make_client(
+        make_response(200, {'result': {'posts': [{'id': '1'}, {'id': '2'}]}}),
+        make_response(200, {'result': {'posts': [{'id': '3'}]}}),
+    )
+
+    success, result = client.batch_dns_records('zone', posts=posts)
+
+    assert success
+    assert [r['id'] for r in result['result']['posts']] == ['1', '2', '3']
+    sent = [sent_json(call) for call in client.session.request.call_args_list]
+    assert sent == [{'posts': posts[:2]}, {'posts': posts[2:]}]
+
+def test_batch_dns_records_stops_on_failure(monkeypatch):
+    """Test that a rejected batch is reported and later batches are not sent"""
+    monkeypatch.setattr(cloudflare_client, 'BATCH_SIZE', 1)
+    error = {'success': False, 'errors': [{'code': 81058, 'message': 'exists'}]}
+    client = make_client(make_response(400, error))
+
+    success, result = client.batch_dns_records('zone', posts=[{'type': 'A'}, {'type': 'A'}])
+
+    assert not success
+    assert result == error
+    assert client.session.request.call_count == 1
+
+def test_record_already_exists():
+    """Test that duplicate-record error codes are recognised"""
+    assert record_already_exists({'errors': [{'code': 81057, 'message': 'Record already exists.'}]})
+    assert not record_already_exists({'errors': [{'code': 9005, 'message': 'Content for A record is invalid.'}]})
+    assert not record_already_exists({'errors': None})
+
+def test_get_dns_records_follows_pagination():
+    """Test that every page of the zone's records is fetched"""
+    client = make_client(
+        make_response(200, {'result': [{'id': '1'}], 'result_info': {'page': 1, 'total_pages': 2}}),
+        make_response(200, {'result': [{'id': '2'}], 'result_info': {'page': 2, 'total_pages': 2}}),
+    )
+
+    assert [r['id'] for r in client.get_dns_records('zone')] == ['1', '2']
+    assert client.session.request.call_count == 2
+
+def test_create_mx_record_with_explicit_priority():
+    """Test that an explicit priority is used as-is for a bare MX server"""
+    client = make_client(make_response(200, {'success': True}))
+
+    client.create_dns_record('zone', 'MX', 'mg.example.com', 'mxa.mailgun.org', priority=10)
+
+    sent = sent_json(client.session.request.call_args)
+    assert sent['content'] == 'mxa.mailgun.org'
+    assert sent['priority'] == 10
+
+def test_create_mx_record_parses_priority_from_content():
+    """Test that "<priority> <server>" content still works without a priority"""
+    client = make_client(make_response(200, {'success': True}))
+
+    client.create_dns_record('zone', 'MX', 'mg.example.com', '20 mxb.mailgun.org')
+
+    sent = sent_json(client.session.request.call_args)
+    assert sent['content'] == 'mxb.mailgun.org'
+    assert sent['priority'] == 20
+
+def test_rate_limited_request_is_retried(monkeypatch):
+    """Test that a 429 response is retried after backing off"""
+    sleeps = []
+    monkeypatch.setattr(cloudflare_client.time, 'sleep', sleeps.append)
+    client = make_client(
+        make_response(429, {'success': False}),
+        make_response(200, {'success': True, 'result': []}),
+    )
+
+    success, _ = client.create_dns_record('zone', 'TXT', 'mg.example.com', 'v=spf1 ~all')
+
+    assert success
+    assert client.session.request.call_count == 2
+    assert len(sleeps) == 1 and 1 <= sleeps[0] <= 2
+
+def test_circuit_opens_after_repeated_rate_limiting(monkeypatch):
+    """Test that calls are refused once Cloudflare keeps rate limiting"""
+    monkeypatch.setattr(cloudflare_client.time, 'sleep', lambda seconds: None)
+    threshold = cloudflare_client.CIRCUIT_BREAKER_THRESHOLD
+    client = make_client(*[make_response(429, {'success': False}) for _ in range(threshold)])
+
+    # One call gives up after its retries without opening the circuit ...
+    assert client.get_dns_records('zone') == []
+    assert client.session.request.call_count == cloudflare_client.RATE_LIMIT_RETRIES + 1
+
+    # ... and the next 429 reaches the threshold and refuses the rest of the call
+    with pytest.raises(CircuitOpenError):
+        client.get_dns_records('zone')
+    assert client.session.request.call_count == threshold
+
+    with pytest.raises(CircuitOpenError):
+        client.get_zone_id('example.com')
+
+def test_circuit_is_shared_by_clients_for_one_account(monkeypatch):
+    """Test that a breaker tripped by one client also stops a new client for the account"""
+    monkeypatch.setattr(cloudflare_client.time, 'sleep', lambda seconds: None)
+    threshold = cloudflare_client.CIRCUIT_BREAKER_THRESHOLD
+    first = make_client(*[make_response(429, {'success': False}) for _ in range(threshold)])
+    first.get_dns_records('zone')
+    with pytest.raises(CircuitOpenError):
+        first.get_dns_records('zone')
+
+    second = CloudflareClient('cf-key', 'admin@example.com')
+    second.session = Mock()
+    with pytest.raises(CircuitOpenError):
+        second.get_zone_id('example.com')
+    second.session.request.assert_not_called()
+
+    other = CloudflareClient('other-key', 'other@example.com')
+    other._limiter = Mock()
+    other.session = Mock()
+    other.session.request.return_value = make_response(200, {'success': True, 'result': [{'id': 'zone'}]})
+    assert other.get_zone_id('example.com') == 'zone'
+
+def test_create_dns_records_batch_builds_posts():
+    """Test that Mailgun-style records become batch posts, splitting MX priority"""
+    client = make_client(make_response(200, {'result': {'posts': [{'id': '1'}, {'id': '2'}]}}))
+
+    success, _ = client.create_dns_records_batch('zone', [
+        {'type': 'TXT', 'name': 'mg.example.com', 'value': 'v=spf1 include:mailgun.org ~all'},
+        {'type': 'MX', 'name': 'mg.example.com', 'value': '10 mxa.mailgun.org'},
+    ])
+
+    assert success
+    assert sent_json(client.session.request.call_args) == {'posts': [
+        {'type': 'TXT', 'name': 'mg.example.com', 'content': 'v=spf1 include:mailgun.org ~all', 'ttl': 1},
+        {'type': 'MX', 'name': 'mg.example.com', 'content': 'mxa.mailgun.org', 'ttl': 1, 'priority': 10},
+    ]}
+
+def test_zone_id_shared_between_clients():
+    """Test that a zone found by one client is reused by another for the same account"""
+    client = make_client(make_response(200, {'result': [{'id': 'zone-1'}]}))
+    assert client.get_zone_id('example.com') == 'zone-1'
+
+    other = CloudflareClient('cf-key', 'admin@example.com')
+    other.session = Mock()
+    assert other.get_zone_id('example.com') == 'zone-1'
+    other.session.request.assert_not_called()
+
+    different_account = CloudflareClient('other-key', 'admin@example.com')
+    different_account.session = Mock()
+    different_account.session.request.return_value = make_response(200, {'result': []})
+    assert different_account.get_zone_id('example.com') is None
+
+def test_clients_share_connection_pool():
+    """Test that separate clients reuse the same keep-alive connection pool"""
+    first = CloudflareClient('key-a', 'a@example.com')
+    second = CloudflareClient('key-b', 'b@example.com')
+    url = 'https://api.cloudflare.com/client/v4/zones'
+    assert first.session.get_adapter(url) is second.session.get_adapter(url)
+    assert first.session.headers['X-Auth-Key'] != second.session.headers['X-Auth-Key']
+
+def test_requests_have_a_timeout():
+    """Test that every Cloudflare call is sent with the default timeout"""
+    client = make_client(
+        make_response(200, {'success': True, 'result': [{'id': 'zone'}]}),
+        make_response(200, {'result': []}),
+        make_response(200, {'success': True, 'result': {}}),
+        make_response(200, {'result': {'posts': [{'id': '1'}]}}),
+    )
+
+    client.get_zone_id('example.com')
+    client.get_dns_records('zone')
+    client.create_dns_record('zone', 'TXT', 'mg.example.com', 'v=spf1 ~all')
+    client.batch_dns_records('zone', posts=[{'type': 'TXT'}])
+
+    calls = client.session.request.call_args_list
+    assert len(calls) == 4
+    assert all(call.kwargs['timeout'] == REQUEST_TIMEOUT for call in calls)
+
+def test_clients_for_one_account_share_a_rate_limiter():
+    """Test that concurrent clients for an account draw on the same request budget"""
+    first = CloudflareClient('cf-key', 'admin@example.com')
+    second = CloudflareClient('cf-key', 'admin@example.com')
+    other = CloudflareClient('other-key', 'other@example.com')
+    assert first._limiter is second._limiter
+    assert first._limiter is not other._limiter
@@ -0,0 +1,63 @@
+# Tests for configuration loading helpers
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from utils.config import Config, load_config
+
+def test_config_load_from_environment():
+    """Test that credentials are read from the environment without prompting"""
+    environ = {
+        'MAILGUN_API_KEY': 'mg-key',
+        'CLOUDFLARE_API_KEY': 'cf-key',
+        'CLOUDFLARE_EMAIL': 'admin@example.com',
+    }
+
+    def prompt(message):
+        raise AssertionError(f"Unexpected prompt: {message}")
+
+    cfg = Config.load(environ=environ, prompt=prompt)
+    assert cfg == Config('mg-key', 'cf-key', 'admin@example.com')
+
+def test_config_load_prompts_for_missing_values():
+    """Test that only missing credentials are prompted for"""
+    prompts = []
+
+    def prompt(message):
+        prompts.append(message)
+        return 'cf-key'
+
+    cfg = Config.load(environ={'MAILGUN_API_KEY': 'mg-key', 'CLOUDFLARE_EMAIL': 'admin@example.com'},
+                      prompt=prompt)
+    assert cfg.cloudflare_api_key == 'cf-key'
+    assert prompts == ['Enter your Cloudflare API Key: ']
+
+
+def test_load_config_parses_env_file(tmp_path):
+    """Test that KEY=value lines are read and comments and blank lines skipped"""
+    env_file = tmp_path / '.env'
+    env_file.write_text('# credentials\n'
+                        'MAILGUN_API_KEY=mg-key\n'
+                        '\n'
+                        '  CLOUDFLARE_EMAIL = admin@example.com  \n'
+                        'CLOUDFLARE_API_KEY=cf=key\n')
+
+    assert load_config(str(env_file)) == {
+        'MAILGUN_API_KEY': 'mg-key',
+        'CLOUDFLARE_EMAIL': 'admin@example.com',
+        'CLOUDFLARE_API_KEY': 'cf=key',
+    }
+
+def test_load_config_missing_file(tmp_path):
+    """Test that a missing .env file gives an empty configuration"""
+    assert load_config(str(tmp_path / 'missing.env')) == {}
+
+def test_load_config_skips_indented_comments(tmp_path):
+    """Test that indented comments and lines without '=' are not read as keys"""
+    env_file = tmp_path / '.env'
+    env_file.write_text('  # MAILGUN_API_KEY=old-key\n'
+                        '\t# note = not a setting\n'
+                        'not a setting\n'
+                        'MAILGUN_API_KEY=mg-key\n')
+
+    assert load_config(str(env_file)) == {'MAILGUN_API_KEY': 'mg-key'}
@@ -0,0 +1,31 @@
+# Tests for the DNSRecord model
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pytest
+
+from models.dns_record import DNSRecord
+
+def test_validate_accepts_mailgun_records():
+    """Test that typical Mailgun records pass validation"""
+    DNSRecord('krs._domainkey.mg.example.com', 'TXT', 'k=rsa; p=abc', None).validate()
+    DNSRecord('mg.example.com', 'MX', 'mxa.mailgun.org', 10).validate()
+
+@pytest.mark.parametrize('name, record_type', [
+    ('mg.example.com', 'BOGUS'),
+    ('bad name.example.com', 'TXT'),
+    ('mg.example.com\n', 'TXT'),
+    ('a' * 254, 'TXT'),
+])
+def test_validate_rejects_invalid_records(name, record_type):
+    """Test that unknown types and malformed names raise ValueError"""
+    with pytest.raises(ValueError):
+        DNSRecord(name, record_type, 'value', None).validate()
+
+def test_priority_is_optional():
+    """Test that records can be built without a priority, by position or keyword"""
+    record = DNSRecord('mg.example.com', record_type='TXT', content='v=spf1 include:mailgun.org ~all')
+    assert record.priority is None
+    assert record == DNSRecord('mg.example.com', 'TXT', 'v=spf1 include:mailgun.org ~all')
+    assert DNSRecord('mg.example.com', 'MX', 'mxa.mailgun.org', 10).priority == 10
@@ -0,0 +1,63 @@
+# Tests for the orjson-backed Flask JSON provider
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import dataclasses
+import decimal
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from markupsafe import Markup
+
+from utils.json_provider import OrjsonProvider
+
+@dataclasses.dataclass
+class Record:
+    name: str
+    priority: int
+
+@pytest.fixture
+def providers():
+    app = Flask(__name__)
+    return OrjsonProvider(app), DefaultJSONProvider(app)
+
+VALUES = {
+    'decimal': decimal.Decimal('1.50'),
+    'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'date': datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+    'dataclass': Record('mg.example.com', 10),
+    'html': Markup('<b>bold</b>'),
+    'nested': {'b': 1, 'a': [1, 2]},
+}
+
+def test_dumps_matches_default_provider(providers):
+    """Test that the extra types Flask supports encode to the same JSON"""
+    fast, default = providers
+    assert fast.loads(fast.dumps(VALUES)) == default.loads(default.dumps(VALUES))
+    assert fast.dumps(VALUES, sort_keys=True, indent=2) == default.dumps(VALUES, sort_keys=True, indent=2)
+
+def test_dumps_honours_arguments(providers):
+    """Test that sort_keys, indent and default arguments take effect"""
+    fast, _ = providers
+    assert fast.dumps({'b': 1, 'a': 2}, sort_keys=False) == '{"b":1,"a":2}'
+    assert fast.dumps({'b': 1, 'a': 2}) == '{"a":2,"b":1}'
+    assert fast.dumps({'a': 1}, indent=2) == '{\n  "a": 1\n}'
+    assert fast.dumps(object(), default=lambda o: 'custom') == '"custom"'
+    # Arguments orjson doesn't support go through the json module
+    assert fast.dumps({'a': 1}, separators=(',', '=')) == '{"a"=1}'
+
+def test_dumps_rejects_unknown_types(providers):
+    """Test that unsupported objects still raise TypeError"""
+    fast, _ = providers
+    with pytest.raises(TypeError):
+        fast.dumps(object())
+
+def test_loads_honours_arguments(providers):
+    """Test that json.loads arguments are applied"""
+    fast, _ = providers
+    assert fast.loads('{"a": 1.5}') == {'a': 1.5}
+    assert fast.loads('{"a": 1.5}', parse_float=decimal.Decimal) == {'a': decimal.Decimal('1.5')}
@@ -0,0 +1,89 @@
+# Tests for MailgunClient response handling, with the HTTP session stubbed out
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import logging
+from unittest.mock import Mock
+
+from api import REQUEST_TIMEOUT
+from api.mailgun_client import MailgunClient
+
+DOMAIN_RESPONSE = {
+    'domain': {'name': 'mg.example.com', 'state': 'unverified'},
+    'sending_dns_records': [
+        {'record_type': 'TXT', 'name': 'mg.example.com', 'value': 'v=spf1 include:mailgun.org ~all'},
+        {'record_type': 'CNAME', 'name': 'email.mg.example.com', 'value': 'mailgun.org'},
+    ],
+    'receiving_dns_records': [
+        {'record_type': 'MX', 'priority': '10', 'value': 'mxa.mailgun.org'},
+    ],
+}
+
+def make_client(status_code, payload):
+    client = MailgunClient('mg-key')
+    response = Mock(status_code=status_code, text='')
+    response.json.return_value = payload
+    client.session = Mock()
+    client.session.request.return_value = response
+    return client
+
+def test_get_domain_dns_records():
+    """Test that sending and receiving records are flattened into one list"""
+    client = make_client(200, DOMAIN_RESPONSE)
+
+    success, records = client.get_domain_dns_records('mg.example.com')
+
+    assert success
+    assert records == [
+        {'type': 'TXT', 'name': 'mg.example.com', 'value': 'v=spf1 include:mailgun.org ~all'},
+        {'type': 'CNAME', 'name': 'email.mg.example.com', 'value': 'mailgun.org'},
+        {'type': 'MX', 'name': 'mg.example.com', 'value': '10 mxa.mailgun.org'},
+    ]
+
+def test_get_domain_dns_records_reuses_cached_domain():
+    """Test that records for an already fetched domain need no extra request"""
+    client = make_client(200, DOMAIN_RESPONSE)
+
+    client.get_domain('mg.example.com')
+    client.get_domain_dns_records('mg.example.com')
+
+    assert client.session.request.call_count == 1
+
+def test_get_domain_dns_records_not_found():
+    """Test that a missing domain reports failure"""
+    client = make_client(404, {'message': 'Domain not found'})
+
+    assert client.get_domain_dns_records('mg.example.com') == (False, [])
+
+def test_get_domain_logs_missing_domain_at_debug(caplog):
+    """Test that an expected 404 isn't logged as a warning, while other errors are"""
+    caplog.set_level(logging.DEBUG, logger='api.mailgun_client')
+    make_client(404, {'message': 'Domain not found'}).get_domain('example.com')
+    make_client(500, {'message': 'Server error'}).get_domain('example.com')
+
+    assert [r.levelno for r in caplog.records] == [logging.DEBUG, logging.WARNING]
+
+def test_create_domain_reports_status_on_failure():
+    """Test that a failed create carries the status code so conflicts can be told apart"""
+    client = MailgunClient('mg-key')
+    response = Mock(status_code=400)
+    response.json.return_value = {'message': 'This domain name is already taken'}
+    client.session = Mock()
+    client.session.request.return_value = response
+
+    assert client.create_domain('mg.example.com') == (
+        False, {'message': 'This domain name is already taken', 'status_code': 400})
+
+def test_requests_have_a_timeout():
+    """Test that every Mailgun call is sent with the default timeout"""
+    client = make_client(200, {'items': []})
+
+    client.create_domain('mg.example.com')
+    client.get_domain('mg.example.com')
+    client.list_domains()
+    client.verify_domain('mg.example.com')
+
+    calls = client.session.request.call_args_list
+    assert [call.args[0] for call in calls] == ['POST', 'GET', 'GET', 'PUT']
+    assert all(call.kwargs['timeout'] == REQUEST_TIMEOUT for call in calls)
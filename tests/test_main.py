@@ -22,6 +22,28 @@ def test_security_verification_route(client):
     response = client.get('/security-verification')
     assert response.status_code == 200
 
+def test_static_pages_show_flash_messages(client):
+    """Test that cached static pages still render pending flash messages"""
+    client.get('/')
+    with client.session_transaction() as sess:
+        sess['_flashes'] = [('error', 'Flashed once')]
+    assert 'Flashed once' in client.get('/').get_data(as_text=True)
+    assert 'Flashed once' not in client.get('/').get_data(as_text=True)
+
+def test_security_headers(client):
+    """Test that every security header is set exactly once"""
+    import main
+    response = client.get('/setup')
+    for name, value in main._SEC_HEADERS:
+        assert response.headers.getlist(name) == [value]
+
+def test_json_responses_skip_page_security_headers(client):
+    """Test that JSON responses only get the headers relevant to them"""
+    response = client.post('/api/perform-automatic-setup', json={'token': 'unknown'})
+    assert response.headers['X-Content-Type-Options'] == 'nosniff'
+    assert 'Content-Security-Policy' not in response.headers
+    assert 'X-Frame-Options' not in response.headers
+
 def test_setup_get_route(client):
     """Test that the setup route returns successfully for GET requests"""
     response = client.get('/setup')
@@ -31,3 +53,320 @@ def test_app_creation():
     """Test that the Flask app can be created"""
     assert app is not None
     assert app.config['SECRET_KEY'] is not None
+
+@pytest.fixture
+def reload_main(monkeypatch):
+    """Re-import main with the given environment; None removes a variable"""
+    import importlib
+    import main
+
+    def reload(**env):
+        for name, value in env.items():
+            if value is None:
+                monkeypatch.delenv(name, raising=False)
+            else:
+                monkeypatch.setenv(name, value)
+        return importlib.reload(main)
+
+    yield reload
+    # Put the environment back, then rebuild main from it for the other tests
+    monkeypatch.undo()
+    importlib.reload(main)
+
+@pytest.mark.parametrize('secret_key', [None, '', 'dev-secret-key-change-in-production'])
+def test_unset_secret_key_is_generated_and_shared(reload_main, secret_key):
+    """Test that a missing, empty or placeholder SECRET_KEY is replaced and exported for workers"""
+    main = reload_main(FLASK_ENV='production', SECRET_KEY=secret_key)
+    assert main.app.secret_key not in (None, '', main.DEV_SECRET_KEY)
+    assert os.environ['SECRET_KEY'] == main.app.secret_key
+
+def test_configured_secret_key_is_used(reload_main):
+    """Test that a real SECRET_KEY from the environment is kept"""
+    main = reload_main(FLASK_ENV='production', SECRET_KEY='configured-key')
+    assert main.app.secret_key == 'configured-key'
+
+@pytest.mark.parametrize('secret_key', [None, ''])
+def test_development_uses_dev_secret_key(reload_main, secret_key):
+    """Test that development falls back to the fixed dev key without exporting it"""
+    main = reload_main(FLASK_ENV='development', SECRET_KEY=secret_key)
+    assert main.app.secret_key == main.DEV_SECRET_KEY
+    assert os.environ.get('SECRET_KEY') == secret_key
+
+def test_development_keeps_configured_secret_key(reload_main):
+    """Test that a SECRET_KEY set for development is used as is"""
+    main = reload_main(FLASK_ENV='development', SECRET_KEY='configured-key')
+    assert main.app.secret_key == 'configured-key'
+
+def setup_fake_clients(monkeypatch, records, batch_succeeds=True, batch_errors=({'code': 81058},)):
+    import main
+
+    class FakeMailgunClient:
+        def __init__(self, api_key):
+            pass
+
+        def create_domain(self, domain_name):
+            return True, {'domain': {'name': domain_name}}
+
+        def get_domain_dns_records(self, domain):
+            return True, records
+
+    class FakeCloudflareClient:
+        def __init__(self, api_key, email):
+            pass
+
+        def get_zone_id(self, domain):
+            return 'zone'
+
+        def create_dns_records_batch(self, zone_id, dns_records):
+            self.batch_calls.append(dns_records)
+            if not batch_succeeds:
+                return False, {'success': False, 'errors': list(batch_errors)}
+            return True, {'success': True, 'result': {'posts': [{'id': str(i)} for i in range(len(dns_records))]}}
+
+        def create_dns_record(self, zone_id, record_type, name, content):
+            self.record_calls.append(name)
+            return True, {'result': {'zone_id': zone_id, 'content': content}}
+
+    FakeCloudflareClient.batch_calls = []
+    FakeCloudflareClient.record_calls = []
+    monkeypatch.setattr(main, 'MailgunClient', FakeMailgunClient)
+    monkeypatch.setattr(main, 'CloudflareClient', FakeCloudflareClient)
+    return FakeCloudflareClient
+
+AUTOMATIC_SETUP_REQUEST = {
+    'domain': 'example.com',
+    'mailgun_api_key': 'mg-key',
+    'cloudflare_api_key': 'cf-key',
+    'cloudflare_email': 'admin@example.com',
+    'zone_id': 'zone',
+}
+
+def test_perform_automatic_setup_creates_all_records(client, monkeypatch):
+    """Test that every Mailgun record is created in Cloudflare in one batch"""
+    import main
+    records = main.get_fallback_dns_records('example.com')
+    fake_cloudflare = setup_fake_clients(monkeypatch, records)
+
+    response = client.post('/api/perform-automatic-setup', json=AUTOMATIC_SETUP_REQUEST)
+
+    data = response.get_json()
+    assert data['success']
+    assert fake_cloudflare.batch_calls == [records]
+    assert [r['record'] for r in data['dns_records']] == records
+    assert all(r['success'] for r in data['dns_records'])
+
+def test_perform_automatic_setup_falls_back_to_single_records(client, monkeypatch):
+    """Test that records are created one by one when the batch is rejected"""
+    import main
+    records = main.get_fallback_dns_records('example.com')
+    setup_fake_clients(monkeypatch, records, batch_succeeds=False)
+
+    response = client.post('/api/perform-automatic-setup', json=AUTOMATIC_SETUP_REQUEST)
+
+    data = response.get_json()
+    assert data['success']
+    assert [r['record'] for r in data['dns_records']] == records
+    assert all(r['success'] for r in data['dns_records'])
+
+def test_setup_keeps_credentials_out_of_urls(client, monkeypatch):
+    """Test that the setup redirect and page carry a token instead of API keys"""
+    import main
+    records = main.get_fallback_dns_records('example.com')
+    fake_cloudflare = setup_fake_clients(monkeypatch, records)
+    form = {k: v for k, v in AUTOMATIC_SETUP_REQUEST.items() if k != 'zone_id'}
+
+    response = client.post('/setup', data=form)
+    location = response.headers['Location']
+    page = client.get(location).get_data(as_text=True)
+    for secret in ('mg-key', 'cf-key', 'admin@example.com'):
+        assert secret not in location
+        assert secret not in page
+
+    token = location.split('token=')[1]
+    data = client.post('/api/perform-automatic-setup', json={'token': token}).get_json()
+    assert data['success']
+    assert fake_cloudflare.batch_calls == [records]
+
+    # Resubmitting the token replays the first result instead of running again
+    assert client.post('/api/perform-automatic-setup', json={'token': token}).get_json() == data
+    assert fake_cloudflare.batch_calls == [records]
+
+def test_failed_setup_can_be_retried_with_its_token(client, monkeypatch):
+    """Test that a token is only used up once its setup succeeds"""
+    import main
+    records = main.get_fallback_dns_records('example.com')
+    fake_cloudflare = setup_fake_clients(monkeypatch, records)
+    attempts = []
+
+    def create_domain(self, domain_name):
+        attempts.append(domain_name)
+        if len(attempts) == 1:
+            return False, {'message': 'Mailgun is unavailable'}
+        return True, {'domain': {'name': domain_name}}
+
+    monkeypatch.setattr(main.MailgunClient, 'create_domain', create_domain)
+    token = main.save_setup_state(**AUTOMATIC_SETUP_REQUEST)
+
+    failed = client.post('/api/perform-automatic-setup', json={'token': token}).get_json()
+    retried = client.post('/api/perform-automatic-setup', json={'token': token}).get_json()
+
+    assert failed == {'success': False, 'error': 'Failed to create Mailgun domain'}
+    assert retried['success']
+    assert fake_cloudflare.batch_calls == [records]
+    assert token not in main.SETUP_STATE
+
+def test_manual_setup_page_can_be_reloaded(client, monkeypatch):
+    """Test that the manual records page keeps working for its token's lifetime"""
+    import main
+    monkeypatch.setattr(main, 'get_mailgun_dns_records',
+                        lambda domain, api_key: main.get_fallback_dns_records(domain))
+    token = main.save_setup_state(domain='example.com', mailgun_api_key='mg-key')
+
+    for _ in range(2):
+        response = client.get(f'/manual-setup?token={token}')
+        assert response.status_code == 200
+        assert 'mg.example.com' in response.get_data(as_text=True)
+
+def test_perform_automatic_setup_coalesces_concurrent_duplicates(client, monkeypatch):
+    """Test that a duplicate submitted while the first is running waits for its result"""
+    import threading
+    import main
+    records = main.get_fallback_dns_records('example.com')
+    fake_cloudflare = setup_fake_clients(monkeypatch, records)
+    started, release = threading.Event(), threading.Event()
+    batch = fake_cloudflare.create_dns_records_batch
+
+    def slow_batch(self, zone_id, dns_records):
+        started.set()
+        release.wait(5)
+        return batch(self, zone_id, dns_records)
+
+    monkeypatch.setattr(fake_cloudflare, 'create_dns_records_batch', slow_batch)
+    headers = {'Idempotency-Key': 'double-click'}
+    responses = []
+
+    def submit():
+        with main.app.test_client() as c:
+            responses.append(c.post('/api/perform-automatic-setup', json=AUTOMATIC_SETUP_REQUEST,
+                                    headers=headers).get_json())
+
+    first = threading.Thread(target=submit)
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=submit)
+    second.start()
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    assert len(responses) == 2 and responses[0] == responses[1]
+    assert responses[0]['success']
+    assert fake_cloudflare.batch_calls == [records]
+
+def test_idempotency_key_is_scoped_to_credentials(client, monkeypatch):
+    """Test that another account reusing an Idempotency-Key runs its own setup"""
+    import main
+    records = main.get_fallback_dns_records('example.com')
+    fake_cloudflare = setup_fake_clients(monkeypatch, records)
+    headers = {'Idempotency-Key': '1'}
+    alice = dict(AUTOMATIC_SETUP_REQUEST, domain='alice.com', mailgun_api_key='alice-key')
+    bob = dict(AUTOMATIC_SETUP_REQUEST, domain='bob.com', mailgun_api_key='bob-key')
+
+    first = client.post('/api/perform-automatic-setup', json=alice, headers=headers).get_json()
+    second = client.post('/api/perform-automatic-setup', json=bob, headers=headers).get_json()
+
+    assert first['domain_info']['domain']['name'] == 'mg.alice.com'
+    assert second['domain_info']['domain']['name'] == 'mg.bob.com'
+    assert len(fake_cloudflare.batch_calls) == 2
+
+def test_idempotency_key_rejects_a_different_request(client, monkeypatch):
+    """Test that reusing an Idempotency-Key with a different body is refused"""
+    import main
+    records = main.get_fallback_dns_records('example.com')
+    fake_cloudflare = setup_fake_clients(monkeypatch, records)
+    headers = {'Idempotency-Key': 'reused'}
+
+    first = client.post('/api/perform-automatic-setup', json=AUTOMATIC_SETUP_REQUEST, headers=headers)
+    changed = dict(AUTOMATIC_SETUP_REQUEST, zone_id='other-zone')
+    second = client.post('/api/perform-automatic-setup', json=changed, headers=headers)
+
+    assert first.get_json()['success']
+    assert not second.get_json()['success']
+    assert fake_cloudflare.batch_calls == [records]
+
+def test_json_responses_use_orjson(client):
+    """Test that API responses are encoded by the orjson provider"""
+    import main
+    from utils.json_provider import OrjsonProvider
+    assert isinstance(main.app.json, OrjsonProvider)
+
+    response = client.post('/api/perform-automatic-setup', json={'token': 'unknown'})
+    assert response.mimetype == 'application/json'
+    assert response.get_json() == {'success': False, 'error': 'Setup session expired, please start again'}
+
+def test_perform_automatic_setup_reports_other_batch_errors(client, monkeypatch):
+    """Test that a batch rejected for another reason isn't retried record by record"""
+    import main
+    records = main.get_fallback_dns_records('example.com')
+    fake_cloudflare = setup_fake_clients(monkeypatch, records, batch_succeeds=False,
+                                         batch_errors=[{'code': 10000, 'message': 'Authentication error'}])
+
+    response = client.post('/api/perform-automatic-setup', json=AUTOMATIC_SETUP_REQUEST)
+
+    data = response.get_json()
+    assert not data['success']
+    assert 'Authentication error' in data['error']
+    assert fake_cloudflare.record_calls == []
+
+def make_listing_mailgun_client(items, total_count=None):
+    requested = []
+    records = [{'type': 'TXT', 'name': 'mg.example.com', 'value': 'v=spf1 include:mailgun.org ~all'}]
+
+    class FakeMailgunClient:
+        def __init__(self, api_key):
+            pass
+
+        def list_domains(self):
+            count = len(items) if total_count is None else total_count
+            return True, {'total_count': count, 'items': [{'name': name} for name in items]}
+
+        def get_domain_dns_records(self, domain):
+            requested.append(domain)
+            return (True, records) if domain in items else (False, [])
+
+    return FakeMailgunClient, requested, records
+
+def test_get_mailgun_dns_records_uses_domain_list(monkeypatch):
+    """Test that only the variant present in the account is fetched"""
+    import main
+    fake_client, requested, records = make_listing_mailgun_client(['mg.example.com', 'other.com'])
+    monkeypatch.setattr(main, 'MailgunClient', fake_client)
+
+    assert main.get_mailgun_dns_records('example.com', 'mg-key') == records
+    assert requested == ['mg.example.com']
+
+def test_get_mailgun_dns_records_stops_at_first_listed_variant(monkeypatch):
+    """Test that listed variants are fetched in order until one has records"""
+    import main
+    fake_client, requested, records = make_listing_mailgun_client(['mg.example.com', 'example.com'])
+    monkeypatch.setattr(main, 'MailgunClient', fake_client)
+
+    assert main.get_mailgun_dns_records('example.com', 'mg-key') == records
+    assert requested == ['example.com']
+
+def test_get_mailgun_dns_records_probes_when_list_is_partial(monkeypatch):
+    """Test that every variant is probed if the domain list is incomplete"""
+    import main
+    fake_client, requested, records = make_listing_mailgun_client(['mg.example.com'], total_count=500)
+    monkeypatch.setattr(main, 'MailgunClient', fake_client)
+
+    assert main.get_mailgun_dns_records('example.com', 'mg-key') == records
+    assert sorted(requested) == ['email.example.com', 'example.com', 'mail.example.com', 'mg.example.com']
+
+def test_get_fallback_dns_records_returns_copies():
+    """Test that cached fallback records can't be changed through a result"""
+    import main
+    records = main.get_fallback_dns_records('example.com')
+    assert records[0]['name'] == 'mg.example.com'
+    records[0]['name'] = 'changed'
+    assert main.get_fallback_dns_records('example.com')[0]['name'] == 'mg.example.com'
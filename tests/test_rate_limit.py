@@ -0,0 +1,43 @@
+# Tests for the token-bucket rate limiter used for Cloudflare calls
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from utils import rate_limit
+from utils.rate_limit import RateLimiter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def test_burst_then_throttle(monkeypatch):
+    """Test that calls beyond the bucket size wait for it to refill"""
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, 'time', clock)
+    limiter = RateLimiter(4, 1)
+    for _ in range(4):
+        limiter.acquire()
+    assert clock.sleeps == []
+
+    limiter.acquire()
+    assert clock.sleeps == [0.25]
+
+def test_bucket_refills_over_time(monkeypatch):
+    """Test that idle time restores the allowance"""
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, 'time', clock)
+    limiter = RateLimiter(2, 1)
+    limiter.acquire()
+    limiter.acquire()
+    clock.now += 1
+    limiter.acquire()
+    limiter.acquire()
+    assert clock.sleeps == []